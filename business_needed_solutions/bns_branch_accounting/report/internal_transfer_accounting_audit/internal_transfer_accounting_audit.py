@@ -1515,12 +1515,15 @@ def _audit_cross_document_consistency(filters, settings):
 
 	def _has_internal_gl(voucher_type, voucher_no):
 		"""Return True if document has any active GL entries on BNS internal accounts."""
-		placeholders = ", ".join(["%s"] * len(internal_accounts))
 		count = frappe.db.sql(
-			f"""SELECT COUNT(*) FROM `tabGL Entry`
-			WHERE voucher_type = %s AND voucher_no = %s
-			AND is_cancelled = 0 AND account IN ({placeholders})""",
-			(voucher_type, voucher_no, *internal_accounts),
+			"""SELECT COUNT(*) FROM `tabGL Entry`
+			WHERE voucher_type = %(voucher_type)s AND voucher_no = %(voucher_no)s
+			AND is_cancelled = 0 AND account IN %(accounts)s""",
+			{
+				"voucher_type": voucher_type,
+				"voucher_no": voucher_no,
+				"accounts": tuple(internal_accounts),
+			},
 		)[0][0]
 		return count > 0
 
@@ -1890,14 +1893,12 @@ def _sum_internal_accounts(voucher_nos, accounts):
 	"""
 	if not voucher_nos or not accounts:
 		return {}
-	v_ph = ", ".join(["%s"] * len(voucher_nos))
-	a_ph = ", ".join(["%s"] * len(accounts))
 	rows = frappe.db.sql(
-		f"""SELECT account, COALESCE(SUM(debit), 0) AS d, COALESCE(SUM(credit), 0) AS c
+		"""SELECT account, COALESCE(SUM(debit), 0) AS d, COALESCE(SUM(credit), 0) AS c
 		   FROM `tabGL Entry`
-		   WHERE voucher_no IN ({v_ph}) AND account IN ({a_ph}) AND is_cancelled = 0
+		   WHERE voucher_no IN %(voucher_nos)s AND account IN %(accounts)s AND is_cancelled = 0
 		   GROUP BY account""",
-		(*voucher_nos, *accounts),
+		{"voucher_nos": tuple(voucher_nos), "accounts": tuple(accounts)},
 		as_dict=True,
 	)
 	return {r.account: (flt(r.d), flt(r.c)) for r in rows}
@@ -20,30 +20,90 @@ Matching Logic:
 
 """
 
+import heapq
 import json
+from collections import defaultdict
+from datetime import date
+from itertools import groupby
 
 import frappe
 from frappe import _
+from frappe.query_builder import DocType
+from frappe.query_builder.functions import Coalesce
 from frappe.utils import cint, today, flt, getdate
 
 # Amounts: round to 2 decimals; qty: round to 6 decimals.
 # DN-PR uses hardcoded tolerances (₹5 / 0.01).
 # SI-PI uses si_pi_amount_tolerance from BNS Branch Accounting Settings.
+_DN_PR_AMOUNT_TOLERANCE = 5.0
+_DN_PR_TAX_TOLERANCE = 0.01
+_DN_PR_QTY_TOLERANCE = 0.01
+
+# Mismatch reason templates, bound once and applied only to the entries that
+# are actually shown (reasons are capped at _DN_REASON_ITEM_LIMIT item-level
+# entries for DN-PR and _SI_REASON_LIMIT entries for SI-PI).
+# DN-PR entries are (item, dn_qty, dn_taxable_value) for "missing",
+# (item, dn_qty, pr_qty) for "qty_mismatch" and
+# (item, dn_taxable_value, pr_taxable_value) for "taxable_value_mismatch".
+_DN_REASON_ITEM_LIMIT = 5
+_SI_REASON_LIMIT = 8
+# Item-code pairs shown in item_mismatch_details; the rest are only counted
+_ITEM_CODE_MISMATCH_LIMIT = 3
+_DN_ITEM_MISMATCH_FORMATS = {
+	"missing": "{0} (DN Qty: {1}, PR: Missing (Taxable Value: ₹{2:.2f}))".format,
+	"qty_mismatch": "{0} (DN Qty: {1}, PR Qty: {2})".format,
+	"taxable_value_mismatch": "{0} (DN Taxable Value: ₹{1:.2f}, PR Taxable Value: ₹{2:.2f})".format,
+}
+_SI_MISMATCH_FORMATS = {
+	"missing": "{item} (SI Qty: {si_qty}, Taxable Value: ₹{si_taxable_value:.2f}, PI: Missing)".format,
+	"qty_mismatch": "{item} (SI Qty: {si_qty}, PI Qty: {pi_qty})".format,
+	"taxable_value_mismatch": (
+		"{item} (SI Taxable Value: ₹{si_taxable_value:.2f}, PI Taxable Value: ₹{pi_taxable_value:.2f})"
+	).format,
+	"extra": "{item} (Extra in PI: Qty {pi_qty}, Taxable Value ₹{pi_taxable_value:.2f})".format,
+	"grand_total": "Grand Total: SI ₹{si_total:.2f} vs PI ₹{pi_total:.2f} (Diff: ₹{abs_diff:.2f})".format,
+	"tax": "Total Taxes and Charges: SI ₹{si_tax:.2f} vs PI ₹{pi_tax:.2f} (Diff: ₹{abs_diff:.2f})".format,
+}
+
+# Header fields read for the PIs/PRs linked to a batch of Sales Invoices
+_PI_HEADER_FIELDS = (
+	"grand_total", "total_taxes_and_charges", "base_total_taxes_and_charges", "net_total", "location",
+)
+_PR_HEADER_FIELDS = ("location",)
+
+# DN/SI documents are checked in batches of this many, with one set of bulk
+# item queries per batch, so rows can be yielded before the whole list is read.
+_ROW_BATCH_SIZE = 500
+
+
+def _to_cents(value):
+	"""Scale an amount to integer paise (2 decimals)."""
+	return int(round(flt(value or 0) * 100))
+
+
+def _to_micro_units(value):
+	"""Scale a quantity to integer millionths (6 decimals)."""
+	return int(round(flt(value or 0) * 1_000_000))
 
 
 def _amounts_equal(a, b):
 	"""Compare amounts with no tolerance; round to 2 decimals."""
-	return round(flt(a or 0), 2) == round(flt(b or 0), 2)
+	return _to_cents(a) == _to_cents(b)
 
 
 def _amounts_within_tolerance(a, b, tolerance):
 	"""Compare amounts allowing a configurable tolerance (absolute value)."""
-	return abs(round(flt(a or 0), 2) - round(flt(b or 0), 2)) <= flt(tolerance or 0)
+	return abs(_to_cents(a) - _to_cents(b)) <= flt(tolerance or 0) * 100
 
 
 def _qtys_equal(a, b):
 	"""Compare quantities with no tolerance; round to 6 decimals."""
-	return round(flt(a or 0), 6) == round(flt(b or 0), 6)
+	return _to_micro_units(a) == _to_micro_units(b)
+
+
+def _qtys_within_tolerance(a, b, tolerance):
+	"""Compare quantities allowing a fixed tolerance (absolute value); round to 6 decimals."""
+	return abs(_to_micro_units(a) - _to_micro_units(b)) <= flt(tolerance or 0) * 1_000_000
 
 
 def _get_si_pi_amount_tolerance():
@@ -55,6 +115,11 @@ def _get_si_pi_amount_tolerance():
 
 _ALLOWED_ADDRESS_SEARCHFIELDS = {"name", "address_title"}
 
+# Company address lookups fire on every keystroke in the filter; cache them
+# briefly and drop the cache whenever an Address changes (see hooks.py).
+_ADDRESS_QUERY_CACHE_PREFIX = "bns:addr_q:"
+_ADDRESS_QUERY_CACHE_TTL = 300
+
 
 @frappe.whitelist()
 def company_address_query(doctype, txt, searchfield, start, page_len, filters):
@@ -90,6 +155,14 @@ def company_address_query(doctype, txt, searchfield, start, page_len, filters):
 	values["page_len"] = int(page_len or 20)
 	values["start"] = int(start or 0)
 
+	cache_key = (
+		f"{_ADDRESS_QUERY_CACHE_PREFIX}{values.get('company') or ''}:{searchfield}:"
+		f"{txt or ''}:{values['start']}:{values['page_len']}"
+	)
+	cached = frappe.cache().get_value(cache_key)
+	if cached is not None:
+		return cached
+
 	where_clause = " AND ".join(conditions)
 	query = f"""
 		SELECT
@@ -101,7 +174,53 @@ def company_address_query(doctype, txt, searchfield, start, page_len, filters):
 		LIMIT %(page_len)s
 		OFFSET %(start)s
 	"""
-	return frappe.db.sql(query, values)
+	result = frappe.db.sql(query, values)
+	frappe.cache().set_value(cache_key, result, expires_in_sec=_ADDRESS_QUERY_CACHE_TTL)
+	return result
+
+
+def clear_company_address_query_cache(doc=None, method=None):
+	"""Address doc_event: invalidate cached company_address_query results."""
+	frappe.cache().delete_keys(_ADDRESS_QUERY_CACHE_PREFIX)
+
+
+_INTERNAL_CUSTOMERS_CACHE_KEY = "bns:internal_customers"
+_INTERNAL_CUSTOMERS_CACHE_TTL = 600
+
+
+def _get_internal_customers():
+	"""Return the (small, rarely changing) list of BNS internal customers, cached in Redis.
+
+	Filtering DN/SI by ``customer IN (...)`` lets the DN/SI indexes cover the
+	outer queries instead of joining tabCustomer on every run.
+	"""
+	customers = frappe.cache().get_value(_INTERNAL_CUSTOMERS_CACHE_KEY)
+	if customers is None:
+		customers = frappe.get_all(
+			"Customer", filters={"is_bns_internal_customer": 1}, pluck="name"
+		)
+		frappe.cache().set_value(
+			_INTERNAL_CUSTOMERS_CACHE_KEY, customers, expires_in_sec=_INTERNAL_CUSTOMERS_CACHE_TTL
+		)
+	return customers
+
+
+def clear_internal_customers_cache(doc=None, method=None):
+	"""Customer doc_event: invalidate the cached internal customer list."""
+	frappe.cache().delete_value(_INTERNAL_CUSTOMERS_CACHE_KEY)
+
+
+def _request_cache():
+	"""Per-request memo for this report's SI/PI checks and queued errors.
+
+	Lives on frappe.local.flags, so it is dropped at the end of the request
+	and a second execute() within the same request reuses the work.
+	"""
+	cache = frappe.local.flags.get("_bns_itrm_cache")
+	if cache is None:
+		cache = {}
+		frappe.local.flags["_bns_itrm_cache"] = cache
+	return cache
 
 
 def execute(filters=None):
@@ -239,42 +358,56 @@ def get_data(filters=None):
 	Returns:
 		list: List of dictionaries containing report data
 	"""
-	data = []
-	
-	# Get Delivery Notes with internal customers that are missing Purchase Receipts
-	dn_data = get_delivery_note_mismatches(filters)
-	data.extend(dn_data)
-	
-	# Get Sales Invoices with internal customers that are missing Purchase Invoices or Purchase Receipts
-	si_data = get_sales_invoice_mismatches(filters)
-	data.extend(si_data)
+	try:
+		return list(_iter_rows(filters))
+	finally:
+		_flush_report_errors()
+
+
+def _iter_rows(filters=None):
+	"""Yield report rows ordered by posting date descending.
+
+	DN and SI rows are produced lazily batch by batch; only the (small)
+	linkage-glitch sections are built up front.
+	"""
+	# DN and SI rows come back from SQL already ordered by posting date
+	# descending (the DN/SI outer queries ORDER BY posting_date DESC).
+	dn_data = _iter_delivery_note_mismatches(filters)
+	si_data = _iter_sales_invoice_mismatches(filters)
+
+	# Linkage-glitch rows are assembled from several small queries each, so
+	# they are ordered locally before the merge.
+	glitch_data = []
 
 	# Include orphan/invalid internal PR/PI rows based on linkage rules.
-	internal_purchase_mismatch_data = get_internal_purchase_doc_linkage_mismatches(filters)
-	data.extend(internal_purchase_mismatch_data)
+	glitch_data.extend(get_internal_purchase_doc_linkage_mismatches(filters))
 
 	# Detect asymmetric references: PR has bns_inter_company_reference → DN,
 	# but DN's bns_inter_company_reference is empty.
-	asymmetric_data = get_asymmetric_reference_mismatches(filters)
-	data.extend(asymmetric_data)
+	glitch_data.extend(get_asymmetric_reference_mismatches(filters))
 
 	# Detect legacy linkage glitches: duplicate claimants on one source,
 	# internal refs on non-internal-party docs, and conflicting DN back-refs.
-	legacy_glitch_data = get_duplicate_and_foreign_reference_mismatches(filters)
-	data.extend(legacy_glitch_data)
+	glitch_data.extend(get_duplicate_and_foreign_reference_mismatches(filters))
 
 	# Detect EXTERNAL parties treated as internal: a doc is flagged / statused
 	# internal (or posts internal GL) but its Customer/Supplier master is not
 	# flagged internal. Catches naming-collision cases (e.g. an external
 	# supplier whose bill_no matches our Sales Invoice series).
-	external_internal_data = get_external_party_internal_mismatches(filters)
-	data.extend(external_internal_data)
+	glitch_data.extend(get_external_party_internal_mismatches(filters))
 
-	# Sort by posting date descending (handle None values)
-	if data:
-		data.sort(key=lambda x: x.get("posting_date") or today(), reverse=True)
-	
-	return data or []
+	# Merge the ordered streams by posting date descending (None sorts as today)
+	today_date = getdate(today())
+
+	def sort_key(row):
+		posting_date = row.get("posting_date")
+		if not posting_date:
+			return today_date
+		# Rows straight from SQL already carry a date; only parse anything else
+		return posting_date if type(posting_date) is date else getdate(posting_date)
+
+	glitch_data.sort(key=sort_key, reverse=True)
+	yield from heapq.merge(dn_data, si_data, glitch_data, key=sort_key, reverse=True)
 
 
 def _apply_cutoff_filters(filters):
@@ -289,8 +422,68 @@ def _apply_cutoff_filters(filters):
 	return filters
 
 
-def _link_flags_from_refs(*refs):
-	"""Return link flags for DN/SI from given reference values."""
+def _apply_document_filters(query, table, filters):
+	"""Apply the report's optional company/customer/address/date filters to a DN/SI query."""
+	if not filters:
+		return query
+
+	if filters.get("company"):
+		query = query.where(table.company == filters.get("company"))
+	if filters.get("customer"):
+		query = query.where(table.customer == filters.get("customer"))
+	if filters.get("company_address"):
+		query = query.where(table.company_address == filters.get("company_address"))
+	if filters.get("from_date"):
+		query = query.where(table.posting_date >= filters.get("from_date"))
+	if filters.get("to_date"):
+		query = query.where(table.posting_date <= filters.get("to_date"))
+	return query
+
+
+def _apply_ordering(query, table):
+	"""Order a DN/SI query newest first (posting date, then name)."""
+	return query.orderby(table.posting_date, order=frappe.qb.desc).orderby(
+		table.name, order=frappe.qb.desc
+	)
+
+
+def _existing_names(doctype, names):
+	"""Return which of the given names exist as doctype, in one IN query."""
+	names = {(name or "").strip() for name in names} - {""}
+	if not names:
+		return set()
+	return set(frappe.get_all(doctype, filters={"name": ["in", list(names)]}, pluck="name"))
+
+
+# Report filter -> (column, operator) for the raw-SQL sections
+_SQL_FILTER_MAP = (
+	("company", "company", "="),
+	("from_date", "posting_date", ">="),
+	("to_date", "posting_date", "<="),
+)
+
+
+def _build_filters(prefix, filters):
+	"""Return (conditions, values) for the company/date filters on a table alias.
+
+	prefix is the SQL alias (e.g. "dn"), or empty for unaliased queries.
+	"""
+	column_prefix = f"{prefix}." if prefix else ""
+	conditions, values = [], []
+	for key, column, operator in _SQL_FILTER_MAP:
+		value = filters.get(key)
+		if value:
+			conditions.append(f"{column_prefix}{column} {operator} %s")
+			values.append(value)
+	return conditions, values
+
+
+def _link_flags_from_refs(*refs, existing_dns=None, existing_sis=None):
+	"""Return link flags for DN/SI from given reference values.
+
+	existing_dns / existing_sis are optional prefetched name sets (from
+	_existing_names); without them each reference is checked with exists().
+	"""
 	seen = set()
 	values = []
 	for ref in refs:
@@ -299,8 +492,14 @@ def _link_flags_from_refs(*refs):
 			seen.add(ref)
 			values.append(ref)
 
-	has_dn = any(frappe.db.exists("Delivery Note", ref) for ref in values)
-	has_si = any(frappe.db.exists("Sales Invoice", ref) for ref in values)
+	if existing_dns is None:
+		has_dn = any(frappe.db.exists("Delivery Note", ref) for ref in values)
+	else:
+		has_dn = any(ref in existing_dns for ref in values)
+	if existing_sis is None:
+		has_si = any(frappe.db.exists("Sales Invoice", ref) for ref in values)
+	else:
+		has_si = any(ref in existing_sis for ref in values)
 	return has_dn, has_si
 
 
@@ -316,39 +515,49 @@ def _resolve_scope(company_gstin, billing_gstin, has_dn, has_si):
 	return None
 
 
-def _diff_gstin_dn_pr_allowed(ref, global_allow):
+def _diff_gstin_dn_pr_allowed(ref, global_allow, dn_allow_map=None):
 	"""True when a diff-GSTIN DN->PR is a SUPPORTED transfer (routes through the
 	same-GSTIN path), mirroring the audit report's _classify_pr: the global
 	"allow different GSTIN DN->PR" setting is on, or the linked Delivery Note
 	carries the per-doc opt-in (bns_allow_diff_gstin_dn_pr -- the 'Submit as Diff
 	GSTIN Internal Transfer' option). Legacy DN-linked diff-GSTIN PRs created
 	before that option are valid whenever the global setting is enabled.
+
+	dn_allow_map is an optional prefetched {dn: flag} map from
+	_get_dn_diff_gstin_allow_map.
 	"""
 	if global_allow:
 		return True
 	ref = (ref or "").strip()
+	if dn_allow_map is not None:
+		return bool(dn_allow_map.get(ref))
 	if ref and frappe.db.exists("Delivery Note", ref):
 		if frappe.get_meta("Delivery Note").has_field("bns_allow_diff_gstin_dn_pr"):
 			return bool(frappe.db.get_value("Delivery Note", ref, "bns_allow_diff_gstin_dn_pr"))
 	return False
 
 
+def _get_dn_diff_gstin_allow_map(dn_names):
+	"""Map each given DN to its bns_allow_diff_gstin_dn_pr flag in one query."""
+	if not dn_names or not frappe.get_meta("Delivery Note").has_field("bns_allow_diff_gstin_dn_pr"):
+		return {}
+	return dict(
+		frappe.get_all(
+			"Delivery Note",
+			filters={"name": ["in", list(dn_names)]},
+			fields=["name", "bns_allow_diff_gstin_dn_pr"],
+			as_list=True,
+		)
+	)
+
+
 def get_internal_purchase_doc_linkage_mismatches(filters=None):
 	"""Find submitted internal PR/PI rows violating PR/PI linkage rules."""
 	filters = frappe._dict(filters or {})
 	data = []
 
-	common_conditions = ["docstatus = 1", "is_bns_internal_supplier = 1"]
-	common_values = []
-	if filters.get("company"):
-		common_conditions.append("company = %s")
-		common_values.append(filters.get("company"))
-	if filters.get("from_date"):
-		common_conditions.append("posting_date >= %s")
-		common_values.append(filters.get("from_date"))
-	if filters.get("to_date"):
-		common_conditions.append("posting_date <= %s")
-		common_values.append(filters.get("to_date"))
+	common_conditions, common_values = _build_filters("", filters)
+	common_conditions[:0] = ["docstatus = 1", "is_bns_internal_supplier = 1"]
 
 	pr_rows = frappe.db.sql(
 		f"""
@@ -366,9 +575,20 @@ def get_internal_purchase_doc_linkage_mismatches(filters=None):
 		frappe.db.get_single_value("BNS Branch Accounting Settings", "allow_different_gstin_dn_to_pr")
 	)
 
+	# Resolve every PR reference with IN queries up front rather than with
+	# exists()/get_value() calls per PR.
+	pr_refs = [pr.get("bns_inter_company_reference") for pr in pr_rows]
+	existing_dns = _existing_names("Delivery Note", pr_refs)
+	existing_sis = _existing_names("Sales Invoice", pr_refs)
+	dn_allow_map = (
+		{} if global_allow_diff_gstin_dn_pr else _get_dn_diff_gstin_allow_map(existing_dns)
+	)
+
 	for pr in pr_rows:
 		has_dn, has_si = _link_flags_from_refs(
 			pr.get("bns_inter_company_reference"),
+			existing_dns=existing_dns,
+			existing_sis=existing_sis,
 		)
 		scope = _resolve_scope(
 			pr.get("company_gstin"),
@@ -382,7 +602,7 @@ def get_internal_purchase_doc_linkage_mismatches(filters=None):
 		# treat its scope as "same" exactly like the audit's _classify_pr -- this
 		# stops legacy 'Submit as Diff GSTIN Internal Transfer' PRs being flagged.
 		if scope == "different" and has_dn and _diff_gstin_dn_pr_allowed(
-			pr.get("bns_inter_company_reference"), global_allow_diff_gstin_dn_pr
+			pr.get("bns_inter_company_reference"), global_allow_diff_gstin_dn_pr, dn_allow_map
 		):
 			scope = "same"
 
@@ -429,33 +649,55 @@ def get_internal_purchase_doc_linkage_mismatches(filters=None):
 		as_dict=True,
 	) or []
 
+	diff_gstin_pis = []
 	for pi in pi_rows:
 		company_gstin = (pi.get("company_gstin") or "").strip()
 		billing_gstin = (pi.get("supplier_gstin") or "").strip()
-		if not (company_gstin and billing_gstin and company_gstin != billing_gstin):
-			continue
-
-		_, has_si_direct = _link_flags_from_refs(pi.get("bns_inter_company_reference"))
-
-		pr_names = frappe.get_all(
+		if company_gstin and billing_gstin and company_gstin != billing_gstin:
+			diff_gstin_pis.append(pi)
+
+	# Bulk-load the PRs each PI bills and those PRs' references, then check
+	# all PI/PR references for DN/SI existence in one query per doctype.
+	prs_by_pi = defaultdict(set)
+	if diff_gstin_pis:
+		for row in frappe.get_all(
 			"Purchase Invoice Item",
-			filters={"parent": pi.get("name")},
-			pluck="purchase_receipt",
-		) or []
-		pr_names = sorted({(name or "").strip() for name in pr_names if name})
-
-		has_valid_pr_link = False
-		for pr_name in pr_names:
-			pr_link = frappe.db.get_value(
+			filters={"parent": ["in", [pi.get("name") for pi in diff_gstin_pis]]},
+			fields=["parent", "purchase_receipt"],
+		):
+			if (row.purchase_receipt or "").strip():
+				prs_by_pi[row.parent].add(row.purchase_receipt.strip())
+	pr_ref_by_name = {}
+	linked_prs = set().union(*prs_by_pi.values())
+	if linked_prs:
+		pr_ref_by_name = dict(
+			frappe.get_all(
 				"Purchase Receipt",
-				pr_name,
-				["bns_inter_company_reference"],
-				as_dict=True,
+				filters={"name": ["in", list(linked_prs)]},
+				fields=["name", "bns_inter_company_reference"],
+				as_list=True,
 			)
-			if not pr_link:
+		)
+	refs = [pi.get("bns_inter_company_reference") for pi in diff_gstin_pis]
+	refs.extend(pr_ref_by_name.values())
+	existing_dns = _existing_names("Delivery Note", refs)
+	existing_sis = _existing_names("Sales Invoice", refs)
+
+	for pi in diff_gstin_pis:
+		_, has_si_direct = _link_flags_from_refs(
+			pi.get("bns_inter_company_reference"),
+			existing_dns=existing_dns,
+			existing_sis=existing_sis,
+		)
+
+		has_valid_pr_link = False
+		for pr_name in prs_by_pi.get(pi.get("name"), ()):
+			if pr_name not in pr_ref_by_name:
 				continue
 			pr_has_dn, pr_has_si = _link_flags_from_refs(
-				pr_link.get("bns_inter_company_reference"),
+				pr_ref_by_name[pr_name],
+				existing_dns=existing_dns,
+				existing_sis=existing_sis,
 			)
 			if pr_has_si and not pr_has_dn:
 				has_valid_pr_link = True
@@ -495,23 +737,13 @@ def get_asymmetric_reference_mismatches(filters=None):
 	link was never completed.
 	"""
 	filters = frappe._dict(filters or {})
-	conditions = [
+	conditions, values = _build_filters("dn", filters)
+	conditions[:0] = [
 		"pr.docstatus = 1",
 		"pr.is_bns_internal_supplier = 1",
 		"pr.bns_inter_company_reference IS NOT NULL",
 		"pr.bns_inter_company_reference != ''",
 	]
-	values = []
-
-	if filters.get("company"):
-		conditions.append("dn.company = %s")
-		values.append(filters.get("company"))
-	if filters.get("from_date"):
-		conditions.append("dn.posting_date >= %s")
-		values.append(filters.get("from_date"))
-	if filters.get("to_date"):
-		conditions.append("dn.posting_date <= %s")
-		values.append(filters.get("to_date"))
 
 	rows = frappe.db.sql(
 		f"""
@@ -602,19 +834,6 @@ def get_duplicate_and_foreign_reference_mismatches(filters=None):
 	filters = frappe._dict(filters or {})
 	data = []
 
-	def _conds(alias):
-		conds, vals = [], []
-		if filters.get("company"):
-			conds.append(f"{alias}.company = %s")
-			vals.append(filters.get("company"))
-		if filters.get("from_date"):
-			conds.append(f"{alias}.posting_date >= %s")
-			vals.append(filters.get("from_date"))
-		if filters.get("to_date"):
-			conds.append(f"{alias}.posting_date <= %s")
-			vals.append(filters.get("to_date"))
-		return conds, vals
-
 	def _resolve_source_doctype(name):
 		if frappe.db.exists("Delivery Note", name):
 			return "Delivery Note"
@@ -624,7 +843,7 @@ def get_duplicate_and_foreign_reference_mismatches(filters=None):
 
 	# ── 1 + 2: claimant side (PR / PI) ─────────────────────────────────
 	for claim_dt in ("Purchase Receipt", "Purchase Invoice"):
-		conds, vals = _conds("d")
+		conds, vals = _build_filters("d", filters)
 		where = " AND ".join(
 			["d.docstatus = 1", "COALESCE(d.bns_inter_company_reference, '') != ''"] + conds
 		)
@@ -703,7 +922,7 @@ def get_duplicate_and_foreign_reference_mismatches(filters=None):
 		("Delivery Note", "COALESCE(d.bns_inter_company_reference, '') != ''"),
 		("Sales Invoice", "COALESCE(d.bns_inter_company_reference, '') != ''"),
 	):
-		conds, vals = _conds("d")
+		conds, vals = _build_filters("d", filters)
 		where = " AND ".join(
 			["d.docstatus = 1", backref_check, "COALESCE(d.is_bns_internal_customer, 0) = 0"] + conds
 		)
@@ -732,7 +951,7 @@ def get_duplicate_and_foreign_reference_mismatches(filters=None):
 			))
 
 	# ── 3: conflicting claim — PR refs DN, DN back-refs a different PR ──
-	conds, vals = _conds("pr")
+	conds, vals = _build_filters("pr", filters)
 	where = " AND ".join(
 		["pr.docstatus = 1", "COALESCE(pr.bns_inter_company_reference, '') != ''"] + conds
 	)
@@ -794,29 +1013,31 @@ def get_external_party_internal_mismatches(filters=None):
 		("Purchase Receipt", "supplier", "Supplier", "is_bns_internal_supplier", "is_bns_internal_supplier"),
 	]
 
+	internal_customers = tuple(_get_internal_customers())
+
 	for dt, party_field, party_dt, doc_flag, master_flag in specs:
-		conds = [
+		conds, vals = _build_filters("d", filters)
+		conds[:0] = [
 			"d.docstatus = 1",
 			f"(COALESCE(d.{doc_flag}, 0) = 1 OR d.status = 'BNS Internally Transferred')",
-			f"COALESCE(p.{master_flag}, 0) = 0",
 		]
-		vals = []
-		if filters.get("company"):
-			conds.append("d.company = %s")
-			vals.append(filters.get("company"))
-		if filters.get("from_date"):
-			conds.append("d.posting_date >= %s")
-			vals.append(filters.get("from_date"))
-		if filters.get("to_date"):
-			conds.append("d.posting_date <= %s")
-			vals.append(filters.get("to_date"))
+		if party_dt == "Customer":
+			# Test against the cached internal customer list instead of
+			# joining tabCustomer
+			party_join = ""
+			if internal_customers:
+				conds.insert(2, f"d.{party_field} NOT IN %s")
+				vals.insert(0, internal_customers)
+		else:
+			party_join = f"JOIN `tab{party_dt}` p ON p.name = d.{party_field}"
+			conds.insert(2, f"COALESCE(p.{master_flag}, 0) = 0")
 
 		rows = frappe.db.sql(
 			f"""
 			SELECT d.name, d.posting_date, d.grand_total, d.status,
 			       d.{party_field} AS party, COALESCE(d.{doc_flag}, 0) AS doc_flag
 			FROM `tab{dt}` d
-			JOIN `tab{party_dt}` p ON p.name = d.{party_field}
+			{party_join}
 			WHERE {" AND ".join(conds)}
 			""",
 			tuple(vals),
@@ -850,12 +1071,20 @@ def get_delivery_note_mismatches(filters=None):
 	Returns:
 		list: List of dictionaries with DN mismatch data
 	"""
-	conditions = []
-	values = []
-	
-	# Base conditions
-	conditions.append("c.is_bns_internal_customer = 1")
-	conditions.append("dn.docstatus = 1")
+	try:
+		return list(_iter_delivery_note_mismatches(filters))
+	finally:
+		_flush_report_errors()
+
+
+def _iter_delivery_note_mismatches(filters=None):
+	"""Yield DN mismatch rows in query order, bulk-loading items per batch."""
+	internal_customers = _get_internal_customers()
+	if not internal_customers:
+		return
+
+	DN = DocType("Delivery Note")
+
 	# Include internal DNs on BOTH accounting paths:
 	#   - same GSTIN (billing == company), and
 	#   - diff GSTIN that opted into the internal DN->PR flow (per-doc flag
@@ -865,375 +1094,440 @@ def get_delivery_note_mismatches(filters=None):
 	# never received (empty bns_inter_company_reference / no PR) never surfaced
 	# here. Genuine inter-state SALES (DN->SI) are excluded: they carry neither
 	# the per-doc flag nor the 'BNS Internally Transferred' status.
-	gstin_scope = [
-		"(dn.company_gstin IS NOT NULL AND dn.billing_address_gstin IS NOT NULL AND dn.company_gstin = dn.billing_address_gstin)",
-		"dn.status = 'BNS Internally Transferred'",
-	]
+	gstin_scope = (
+		DN.company_gstin.isnotnull()
+		& DN.billing_address_gstin.isnotnull()
+		& (DN.company_gstin == DN.billing_address_gstin)
+	) | (DN.status == "BNS Internally Transferred")
 	if frappe.get_meta("Delivery Note").has_field("bns_allow_diff_gstin_dn_pr"):
-		gstin_scope.append("COALESCE(dn.bns_allow_diff_gstin_dn_pr, 0) = 1")
-	conditions.append("(" + " OR ".join(gstin_scope) + ")")
-	
-	# Add filter conditions
-	if filters:
-		if filters.get("company"):
-			conditions.append("dn.company = %s")
-			values.append(filters.company)
-		
-		if filters.get("customer"):
-			conditions.append("dn.customer = %s")
-			values.append(filters.customer)
-		
-		if filters.get("company_address"):
-			conditions.append("dn.company_address = %s")
-			values.append(filters.company_address)
-		
-		if filters.get("from_date"):
-			conditions.append("dn.posting_date >= %s")
-			values.append(filters.from_date)
-		
-		if filters.get("to_date"):
-			conditions.append("dn.posting_date <= %s")
-			values.append(filters.to_date)
-	
-	where_clause = " AND ".join(conditions)
-	
+		gstin_scope = gstin_scope | (Coalesce(DN.bns_allow_diff_gstin_dn_pr, 0) == 1)
+
 	# Get all Delivery Notes with internal customers
-	dn_query = """
-		SELECT 
-			dn.posting_date,
-			dn.name,
-			dn.grand_total,
-			dn.company_address as company_address_name,
-			dn.customer_address as customer_address_name
-		FROM 
-			`tabDelivery Note` dn
-		JOIN 
-			`tabCustomer` c ON dn.customer = c.name
-		WHERE 
-			""" + where_clause
-	
+	dn_query = (
+		frappe.qb.from_(DN)
+		.select(
+			DN.posting_date,
+			DN.name,
+			DN.grand_total,
+			DN.net_total,
+			DN.total_taxes_and_charges,
+			DN.base_total_taxes_and_charges,
+			DN.billing_location,
+			DN.company_address.as_("company_address_name"),
+			DN.customer_address.as_("customer_address_name"),
+		)
+		.where(DN.customer.isin(internal_customers))
+		.where(DN.docstatus == 1)
+		.where(gstin_scope)
+	)
+
+	# Read the DN items in the same result set (one row per item) and regroup
+	# them per DN.
+	DNI = DocType("Delivery Note Item")
+	dn_query = dn_query.left_join(DNI).on(DNI.parent == DN.name).select(
+		DNI.name.as_("dn_item_name"),
+		DNI.item_code,
+		DNI.qty,
+		DNI.stock_qty,
+		DNI.net_amount,
+		DNI.base_net_amount,
+	)
+	dn_query = _apply_document_filters(dn_query, DN, filters)
+	dn_query = _apply_ordering(dn_query, DN).orderby(DNI.idx)
+
 	try:
-		dn_results = frappe.db.sql(dn_query, tuple(values), as_dict=True) or []
+		dn_results = dn_query.run(as_dict=True) or []
 	except Exception as e:
-		frappe.log_error(f"Error in get_delivery_note_mismatches: {str(e)}")
+		_record_report_error(f"Error in get_delivery_note_mismatches: {str(e)}")
 		dn_results = []
+
+	dn_results, joined_items_by_parent = _split_dn_item_rows(dn_results)
+
+	failures = []
+	first_traceback = None
+	for start in range(0, len(dn_results), _ROW_BATCH_SIZE):
+		batch = dn_results[start:start + _ROW_BATCH_SIZE]
+
+		# Bulk-fetch the PR items linked to the batch's DN items in one query
+		# instead of one query per DN item. The maps are local to the batch, so
+		# they are released once its rows are yielded.
+		dn_items_by_parent = {
+			dn.get("name"): joined_items_by_parent.get(dn.get("name")) or [] for dn in batch
+		}
+		pr_items_by_dn_item = _get_pr_items_by_dn_item(
+			[item.get("name") for items in dn_items_by_parent.values() for item in items]
+		)
+		dn_item_diffs = _find_dn_item_diffs(
+			dn_items_by_parent, _sum_pr_items_by_dn_item(pr_items_by_dn_item)
+		)
+
+		for dn in batch:
+			try:
+				row = _get_dn_mismatch_row(
+					dn,
+					dn_items_by_parent.get(dn.get("name") or "") or [],
+					pr_items_by_dn_item,
+					dn_item_diffs,
+				)
+			except Exception:
+				failures.append(dn.get("name"))
+				if len(failures) == 1:
+					first_traceback = frappe.get_traceback()
+				continue
+			if row:
+				yield row
+
+	if failures:
+		_log_row_failures("Delivery Note", failures, first_traceback)
+
+
+def _log_row_failures(doctype, failures, first_traceback):
+	"""Queue one summary entry for all rows of one doctype that failed in this run."""
+	_record_report_error(
+		f"{len(failures)} {doctype} row(s) failed. "
+		f"Skipped: {', '.join(str(name) for name in failures[:50])}"
+		+ (f" ... +{len(failures) - 50} more" if len(failures) > 50 else "")
+		+ f"\n\nFirst failure:\n{first_traceback}"
+	)
+
+
+def _record_report_error(message):
+	"""Queue an error for the single Error Log written when the run finishes.
+
+	Errors are collected instead of logged where they happen, so a failure
+	repeated across many batches costs one Error Log insert, not one each.
+	"""
+	_request_cache().setdefault("errors", []).append(message)
+
+
+def _flush_report_errors():
+	"""Write the errors queued by _record_report_error as one Error Log."""
+	errors = _request_cache().pop("errors", None)
+	if not errors:
+		return
+	frappe.log_error(
+		title=f"Internal Transfer Receive Mismatch: {len(errors)} error(s)",
+		message="\n\n".join(errors[:50])
+		+ (f"\n\n... +{len(errors) - 50} more" if len(errors) > 50 else ""),
+	)
+
+
+def _get_dn_mismatch_row(dn, dn_items, pr_items_by_dn_item, dn_item_diffs):
+	"""Build the report row for one Delivery Note, or None when it fully matches its PRs.
+
+	dn_item_diffs holds the batch's qty and taxable value differences from
+	_find_dn_item_diffs.
+	"""
+
+	if not dn_items:
+		# Skip if no items
+		return None
+
+	# No item reached any PR: report it without walking the items
+	if not any(pr_items_by_dn_item.get(item.get("name")) for item in dn_items):
+		return _dn_report_row(dn, "Purchase Receipt", "No PR for DN")
 	
-	mismatches = []
-	for dn in dn_results:
-		dn_name = dn.get("name") or ""
-		
-		# Get all Delivery Note items with taxable values
-		dn_items_query = """
-		SELECT 
-			name,
-			item_code,
-			qty,
-			stock_qty,
-			net_amount,
-			base_net_amount,
-			target_warehouse,
-			warehouse
-		FROM `tabDelivery Note Item`
-		WHERE parent = %s
-		"""
-		
-		try:
-			dn_items = frappe.db.sql(dn_items_query, (dn_name,), as_dict=True) or []
-		except Exception as e:
-			frappe.log_error(f"Error fetching DN items for {dn_name}: {str(e)}")
-			dn_items = []
-		
-		if not dn_items:
-			# Skip if no items
-			continue
-		
-		# Get DN document for totals and taxes
-		dn_doc = frappe.get_doc("Delivery Note", dn_name)
-		dn_grand_total = flt(dn_doc.grand_total or 0)
-		dn_total_taxes = flt(dn_doc.total_taxes_and_charges or 0)
-		dn_net_total = flt(dn_doc.net_total or 0)
-		
-		# Check each DN item against PR items
-		missing_items = []
-		qty_mismatches = []
-		taxable_value_mismatches = []
-		item_code_mismatches = []
-		matched_prs = set()
-		pr_grand_total = 0
-		pr_total_taxes = 0
-		pr_net_total = 0
+	# DN totals and taxes come straight from the outer query
+	dn_grand_total = flt(dn.get("grand_total") or 0)
+	dn_total_taxes = flt(dn.get("total_taxes_and_charges") or 0)
+	dn_net_total = flt(dn.get("net_total") or 0)
+	
+	# Check each DN item against PR items. Item-level differences go into a
+	# single stream of (kind, *values) tuples in discovery order; past
+	# _DN_REASON_ITEM_LIMIT entries they are only counted.
+	mismatches_stream = []
+	extra_count = 0
+	item_code_mismatches = []
+	item_code_mismatch_count = 0
+	matched_prs = {}  # insertion-ordered set of PR names
+	pr_headers = {}
+	
+	for dn_item in dn_items:
+		dn_item_name = dn_item.get("name")
+		dn_qty = flt(dn_item.get("qty") or 0)
+		dn_net_amount = flt(dn_item.get("net_amount") or 0)
+		dn_base_net_amount = flt(dn_item.get("base_net_amount") or 0)
+		item_code = dn_item.get("item_code") or ""
 		
+		# Purchase Receipt items linked to this DN item
+		pr_items = pr_items_by_dn_item.get(dn_item_name) or []
+
+		if not pr_items:
+			# Item not found in any PR
+			if len(mismatches_stream) < _DN_REASON_ITEM_LIMIT:
+				mismatches_stream.append((
+					"missing",
+					item_code,
+					dn_qty,
+					dn_base_net_amount if dn_base_net_amount > 0 else dn_net_amount,
+				))
+			else:
+				extra_count += 1
+		else:
+			dn_ic = item_code.strip()
+			for pr_item in pr_items:
+				# Keep one header row per PR for the consolidated totals below
+				pr_name = pr_item.get("pr_name")
+				pr_headers.setdefault(pr_name, pr_item)
+				matched_prs[pr_name] = None
+
+				pr_ic = (pr_item.get("pr_item_code") or "").strip()
+				if pr_ic and dn_ic and pr_ic != dn_ic:
+					item_code_mismatch_count += 1
+					if item_code_mismatch_count <= _ITEM_CODE_MISMATCH_LIMIT:
+						item_code_mismatches.append((dn_ic, pr_ic))
+			
+			# Qty and taxable value were compared for the whole batch up
+			# front; only differing items have an entry
+			item_diff = dn_item_diffs.get(dn_item_name)
+			if item_diff:
+				for kind, diff in zip(("qty_mismatch", "taxable_value_mismatch"), item_diff):
+					if not diff:
+						continue
+					if len(mismatches_stream) < _DN_REASON_ITEM_LIMIT:
+						mismatches_stream.append((kind, item_code, *diff))
+					else:
+						extra_count += 1
+	
+	# Check grand total and tax mismatches; at least one PR matched (the
+	# no-PR case returned above)
+	grand_total_mismatch = None
+	tax_mismatch = None
+
+	# Consolidated PR totals (sum over each distinct matched PR)
+	pr_grand_total = sum(flt(h.get("grand_total") or 0) for h in pr_headers.values())
+	pr_total_taxes = sum(flt(h.get("total_taxes_and_charges") or 0) for h in pr_headers.values())
+	pr_base_taxes = sum(flt(h.get("base_total_taxes_and_charges") or 0) for h in pr_headers.values())
+
+	# Compare grand totals
+	if not _amounts_within_tolerance(dn_grand_total, pr_grand_total, _DN_PR_AMOUNT_TOLERANCE):
+		grand_total_mismatch = {
+			"dn_total": dn_grand_total,
+			"pr_total": pr_grand_total,
+			"diff": dn_grand_total - pr_grand_total
+		}
+
+	# Compare taxes (in company currency - base_total_taxes_and_charges)
+	dn_base_taxes = flt(dn.get("base_total_taxes_and_charges") or 0)
+	if dn_base_taxes == 0:
+		# Fallback to total_taxes_and_charges if base not available
+		dn_base_taxes = dn_total_taxes
+	if pr_base_taxes == 0:
+		# Fallback to total_taxes_and_charges if base not available
+		pr_base_taxes = pr_total_taxes
+
+	if not _amounts_within_tolerance(dn_base_taxes, pr_base_taxes, _DN_PR_TAX_TOLERANCE):
+		tax_mismatch = {
+			"dn_tax": dn_base_taxes,
+			"pr_tax": pr_base_taxes,
+			"diff": dn_base_taxes - pr_base_taxes
+		}
+
+	# PR exists, show item-wise differences
+	purchase_receipt = next(iter(matched_prs))
+
+	# Build mismatch reason string from the capped item-level stream
+	mismatch_parts = [_DN_ITEM_MISMATCH_FORMATS[kind](*m) for kind, *m in mismatches_stream]
+	if extra_count:
+		mismatch_parts.append(f"and {extra_count} more items")
+
+	# Add grand total mismatch
+	if grand_total_mismatch:
+		mismatch_parts.append(f"Grand Total: DN ₹{grand_total_mismatch['dn_total']:.2f} vs PR ₹{grand_total_mismatch['pr_total']:.2f} (Diff: ₹{abs(grand_total_mismatch['diff']):.2f})")
+	
+	# Add tax mismatch (Total Taxes and Charges in company currency)
+	if tax_mismatch:
+		mismatch_parts.append(f"Total Taxes and Charges: DN ₹{tax_mismatch['dn_tax']:.2f} vs PR ₹{tax_mismatch['pr_tax']:.2f} (Diff: ₹{abs(tax_mismatch['diff']):.2f})")
+	
+	if not mismatch_parts:
+		# No mismatch found, skip this DN
+		return None
+
+	item_mismatch_str = ""
+	if item_code_mismatches:
+		im_parts = []
+		for dn_ic, pr_ic in item_code_mismatches:
+			im_parts.append(f"DN={dn_ic}, PR={pr_ic}")
+		if item_code_mismatch_count > _ITEM_CODE_MISMATCH_LIMIT:
+			im_parts.append(f"... +{item_code_mismatch_count - _ITEM_CODE_MISMATCH_LIMIT} more")
+		item_mismatch_str = " | ".join(im_parts)
+
+	dn_billing_location = (dn.get("billing_location") or "").strip()
+	pr_location = (pr_headers[purchase_receipt].get("pr_location") or "").strip()
+	location_mismatch_str = ""
+	if dn_billing_location and pr_location and dn_billing_location != pr_location:
+		location_mismatch_str = f"DN={dn_billing_location}, PR={pr_location}"
+
+	return _dn_report_row(
+		dn,
+		"Purchase Receipt (Mismatch)",
+		" | ".join(mismatch_parts),
+		purchase_receipt=purchase_receipt,
+		purchase_location=pr_location,
+		location_mismatch=location_mismatch_str,
+		item_mismatch_details=item_mismatch_str,
+	)
+
+
+def _sum_pr_items_by_dn_item(pr_items_by_dn_item):
+	"""Sum PR qty, stock qty, net and base net amount per DN item in one pass.
+
+	Returns:
+		dict: {dn_item: (qty, stock_qty, net_amount, base_net_amount)}
+	"""
+	totals = {}
+	for dn_item_name, pr_items in pr_items_by_dn_item.items():
+		qty = stock_qty = net_amount = base_net_amount = 0
+		for pr_item in pr_items:
+			qty += flt(pr_item.get("pr_qty") or 0)
+			stock_qty += flt(pr_item.get("pr_stock_qty") or 0)
+			net_amount += flt(pr_item.get("pr_net_amount") or 0)
+			base_net_amount += flt(pr_item.get("pr_base_net_amount") or 0)
+		totals[dn_item_name] = (qty, stock_qty, net_amount, base_net_amount)
+	return totals
+
+
+def _find_dn_item_diffs(dn_items_by_parent, pr_totals_by_dn_item):
+	"""Compare every DN item of a batch with its summed PR values in one pass.
+
+	Quantities use stock_qty when the DN item has one, else qty; taxable
+	values use base_net_amount when positive, else net_amount. DN items
+	without PR items are left to the row builder.
+
+	Returns:
+		dict: {dn_item: (qty_diff, value_diff)} for differing items only,
+		each diff a (dn_value, pr_value) pair or None
+	"""
+	diffs = {}
+	for dn_items in dn_items_by_parent.values():
 		for dn_item in dn_items:
 			dn_item_name = dn_item.get("name")
-			dn_qty = flt(dn_item.get("qty") or 0)
+			totals = pr_totals_by_dn_item.get(dn_item_name)
+			if not totals:
+				continue
+			pr_qty, pr_stock_qty, pr_net_amount, pr_base_net_amount = totals
+
 			dn_stock_qty = flt(dn_item.get("stock_qty") or 0)
-			dn_net_amount = flt(dn_item.get("net_amount") or 0)
+			if dn_stock_qty > 0:
+				qty_pair = (dn_stock_qty, pr_stock_qty)
+			else:
+				qty_pair = (flt(dn_item.get("qty") or 0), pr_qty)
+			if _qtys_within_tolerance(qty_pair[0], qty_pair[1], _DN_PR_QTY_TOLERANCE):
+				qty_pair = None
+
 			dn_base_net_amount = flt(dn_item.get("base_net_amount") or 0)
-			
-			# Find Purchase Receipt items linked to this DN item
-			pr_item_query = """
-			SELECT 
+			value_pair = (
+				dn_base_net_amount if dn_base_net_amount > 0 else flt(dn_item.get("net_amount") or 0),
+				pr_base_net_amount if pr_base_net_amount > 0 else pr_net_amount,
+			)
+			if _amounts_within_tolerance(value_pair[0], value_pair[1], _DN_PR_AMOUNT_TOLERANCE):
+				value_pair = None
+
+			if qty_pair or value_pair:
+				diffs[dn_item_name] = (qty_pair, value_pair)
+	return diffs
+
+
+def _dn_report_row(
+	dn,
+	missing_doc,
+	mismatch_reason,
+	purchase_receipt=None,
+	purchase_location="",
+	location_mismatch="",
+	item_mismatch_details="",
+):
+	"""Assemble the report row for a Delivery Note from the outer query row."""
+	return {
+		"posting_date": dn.get("posting_date") or None,
+		"document_type": "Delivery Note",
+		"document_name": dn.get("name") or "",
+		"grand_total": dn.get("grand_total") or 0.0,
+		"company_address_name": dn.get("company_address_name") or "",
+		"customer_address_name": dn.get("customer_address_name") or "",
+		"missing_document": missing_doc,
+		"mismatch_reason": mismatch_reason,
+		"purchase_receipt": purchase_receipt,
+		"purchase_invoice": None,
+		"transfer_chain": "DN->PR",
+		"source_location": (dn.get("billing_location") or "").strip(),
+		"purchase_location": purchase_location,
+		"location_mismatch": location_mismatch,
+		"item_mismatch_details": item_mismatch_details,
+	}
+
+
+def _split_dn_item_rows(rows):
+	"""Split DN header LEFT JOIN DN Item rows into DN headers and items keyed by parent.
+
+	Rows must arrive grouped by DN (the query orders by DN, then item idx).
+	"""
+	headers = []
+	items_by_parent = defaultdict(list)
+	for dn_name, group in groupby(rows, key=lambda row: row.get("name")):
+		group = list(group)
+		headers.append(group[0])
+		for row in group:
+			if not row.get("dn_item_name"):
+				continue
+			item = frappe._dict(
+				parent=dn_name,
+				name=row.get("dn_item_name"),
+				item_code=row.get("item_code"),
+				qty=row.get("qty"),
+				stock_qty=row.get("stock_qty"),
+				net_amount=row.get("net_amount"),
+				base_net_amount=row.get("base_net_amount"),
+			)
+			items_by_parent[dn_name].append(item)
+
+	return headers, items_by_parent
+
+
+def _get_pr_items_by_dn_item(dn_item_names):
+	"""Fetch submitted PR items linked to the given DN items in one query, keyed by delivery_note_item.
+
+	Each row also carries its PR header totals (and location, when the field
+	exists) so callers can consolidate per-PR values without another round-trip.
+	"""
+	items_by_dn_item = defaultdict(list)
+	if not dn_item_names:
+		return items_by_dn_item
+
+	location_column = (
+		", pr.location as pr_location"
+		if frappe.get_meta("Purchase Receipt").has_field("location")
+		else ""
+	)
+	try:
+		rows = frappe.db.sql(
+			f"""
+			SELECT
+				pri.delivery_note_item,
 				pri.parent as pr_name,
 				pri.item_code as pr_item_code,
 				pri.qty as pr_qty,
 				pri.stock_qty as pr_stock_qty,
 				pri.net_amount as pr_net_amount,
 				pri.base_net_amount as pr_base_net_amount,
-				pri.warehouse as pr_warehouse,
-				pr.docstatus,
 				pr.grand_total,
 				pr.total_taxes_and_charges,
-				pr.net_total
+				pr.base_total_taxes_and_charges{location_column}
 			FROM `tabPurchase Receipt Item` pri
 			JOIN `tabPurchase Receipt` pr ON pri.parent = pr.name
-			WHERE pri.delivery_note_item = %s
+			WHERE pri.delivery_note_item IN %(dn_item_names)s
 			AND pr.docstatus = 1
-			"""
-			
-			try:
-				pr_items = frappe.db.sql(pr_item_query, (dn_item_name,), as_dict=True) or []
-			except Exception as e:
-				frappe.log_error(f"Error checking PR items for DN item {dn_item_name}: {str(e)}")
-				pr_items = []
-			
-			if not pr_items:
-				# Item not found in any PR
-				missing_items.append({
-					"item": dn_item.get("item_code") or "",
-					"dn_qty": dn_qty,
-					"dn_taxable_value": dn_base_net_amount if dn_base_net_amount > 0 else dn_net_amount
-				})
-			else:
-				# Aggregate quantities and taxable values from all PRs for this DN item
-				total_pr_qty = 0
-				total_pr_stock_qty = 0
-				total_pr_net_amount = 0
-				total_pr_base_net_amount = 0
-				pr_names_for_item = []
-				
-				for pr_item in pr_items:
-					pr_name = pr_item.get("pr_name")
-					pr_qty = flt(pr_item.get("pr_qty") or 0)
-					pr_stock_qty = flt(pr_item.get("pr_stock_qty") or 0)
-					pr_net_amount = flt(pr_item.get("pr_net_amount") or 0)
-					pr_base_net_amount = flt(pr_item.get("pr_base_net_amount") or 0)
-					
-					# Store PR totals (use first PR's totals)
-					if not matched_prs:
-						pr_grand_total = flt(pr_item.get("grand_total") or 0)
-						pr_total_taxes = flt(pr_item.get("total_taxes_and_charges") or 0)
-						pr_net_total = flt(pr_item.get("net_total") or 0)
-					
-					matched_prs.add(pr_name)
-					pr_names_for_item.append(pr_name)
-					total_pr_qty += pr_qty
-					total_pr_stock_qty += pr_stock_qty
-					total_pr_net_amount += pr_net_amount
-					total_pr_base_net_amount += pr_base_net_amount
-				
-				# Check if aggregated quantities match DN quantity
-				# Use stock_qty if available, else qty
-				if dn_stock_qty > 0:
-					if abs(dn_stock_qty - total_pr_stock_qty) > 0.01:  # Allow difference of 0.01
-						qty_mismatches.append({
-							"item": dn_item.get("item_code") or "",
-							"pr": ", ".join(pr_names_for_item[:3]),  # Show up to 3 PR names
-							"dn_qty": dn_stock_qty,
-							"pr_qty": total_pr_stock_qty
-						})
-				else:
-					if abs(dn_qty - total_pr_qty) > 0.01:  # Allow difference of 0.01
-						qty_mismatches.append({
-							"item": dn_item.get("item_code") or "",
-							"pr": ", ".join(pr_names_for_item[:3]),  # Show up to 3 PR names
-							"dn_qty": dn_qty,
-							"pr_qty": total_pr_qty
-						})
-				
-				# Check taxable value mismatch
-				dn_taxable_value = dn_base_net_amount if dn_base_net_amount > 0 else dn_net_amount
-				pr_taxable_value = total_pr_base_net_amount if total_pr_base_net_amount > 0 else total_pr_net_amount
-				if abs(dn_taxable_value - pr_taxable_value) > 5.0:  # Allow difference of ₹5
-					taxable_value_mismatches.append({
-						"item": dn_item.get("item_code") or "",
-						"dn_taxable_value": dn_taxable_value,
-						"pr_taxable_value": pr_taxable_value
-					})
-
-				for pr_item in pr_items:
-					pr_ic = (pr_item.get("pr_item_code") or "").strip()
-					dn_ic = (dn_item.get("item_code") or "").strip()
-					if pr_ic and dn_ic and pr_ic != dn_ic:
-						item_code_mismatches.append({
-							"dn_item_code": dn_ic,
-							"pr_item_code": pr_ic,
-						})
-		
-		# Check grand total and tax mismatches
-		grand_total_mismatch = None
-		tax_mismatch = None
-		
-		if matched_prs:
-			# Get consolidated PR totals (sum all PRs)
-			pr_totals_query = """
-			SELECT 
-				SUM(grand_total) as total_grand_total,
-				SUM(total_taxes_and_charges) as total_taxes,
-				SUM(base_total_taxes_and_charges) as base_total_taxes,
-				SUM(net_total) as total_net_total
-			FROM `tabPurchase Receipt`
-			WHERE name IN ({})
-			AND docstatus = 1
-			""".format(",".join(["%s"] * len(matched_prs)))
-			
-			try:
-				pr_totals = frappe.db.sql(pr_totals_query, tuple(matched_prs), as_dict=True)
-				if pr_totals and pr_totals[0]:
-					pr_grand_total = flt(pr_totals[0].get("total_grand_total") or 0)
-					pr_total_taxes = flt(pr_totals[0].get("total_taxes") or 0)
-					pr_base_taxes = flt(pr_totals[0].get("base_total_taxes") or 0)
-					pr_net_total = flt(pr_totals[0].get("total_net_total") or 0)
-					
-					# Compare grand totals
-					if abs(dn_grand_total - pr_grand_total) > 5.0:  # Allow difference of ₹5
-						grand_total_mismatch = {
-							"dn_total": dn_grand_total,
-							"pr_total": pr_grand_total,
-							"diff": dn_grand_total - pr_grand_total
-						}
-					
-					# Compare taxes (in company currency - base_total_taxes_and_charges)
-					dn_base_taxes = flt(dn_doc.base_total_taxes_and_charges or 0)
-					if dn_base_taxes == 0:
-						# Fallback to total_taxes_and_charges if base not available
-						dn_base_taxes = dn_total_taxes
-					if pr_base_taxes == 0:
-						# Fallback to total_taxes_and_charges if base not available
-						pr_base_taxes = pr_total_taxes
-					
-					if abs(dn_base_taxes - pr_base_taxes) > 0.01:
-						tax_mismatch = {
-							"dn_tax": dn_base_taxes,
-							"pr_tax": pr_base_taxes,
-							"diff": dn_base_taxes - pr_base_taxes
-						}
-			except Exception as e:
-				frappe.log_error(f"Error checking PR totals for DN {dn_name}: {str(e)}")
-		
-		# Determine mismatch reason
-		mismatch_reason = ""
-		missing_doc = "Purchase Receipt"
-		purchase_receipt = None
-		
-		# Check if PR is completely missing (no PR found for any item)
-		if not matched_prs:
-			# No PR found at all
-			mismatch_reason = "No PR for DN"
-			missing_doc = "Purchase Receipt"
-		else:
-			# PR exists, show item-wise differences
-			purchase_receipt = list(matched_prs)[0]
-			
-			# Combine all mismatches
-			all_mismatches = []
-			
-			# Add missing items
-			for item in missing_items:
-				all_mismatches.append({
-					"item": item['item'],
-					"dn_qty": item['dn_qty'],
-					"pr_qty": 0,
-					"type": "missing",
-					"taxable_value_info": f"Taxable Value: ₹{item.get('dn_taxable_value', 0):.2f}"
-				})
-			
-			# Add quantity mismatches
-			for mismatch in qty_mismatches:
-				all_mismatches.append({
-					"item": mismatch['item'],
-					"dn_qty": mismatch['dn_qty'],
-					"pr_qty": mismatch['pr_qty'],
-					"type": "qty_mismatch"
-				})
-			
-			# Add taxable value mismatches
-			for mismatch in taxable_value_mismatches:
-				all_mismatches.append({
-					"item": mismatch['item'],
-					"dn_taxable_value": mismatch['dn_taxable_value'],
-					"pr_taxable_value": mismatch['pr_taxable_value'],
-					"type": "taxable_value_mismatch"
-				})
-			
-			# Build mismatch reason string
-			mismatch_parts = []
-			
-			if all_mismatches:
-				# Show item-wise differences
-				for m in all_mismatches[:5]:  # Show up to 5 items
-					if m['type'] == "missing":
-						taxable_value_info = f" ({m.get('taxable_value_info', '')})" if m.get('taxable_value_info') else ""
-						mismatch_parts.append(f"{m['item']} (DN Qty: {m['dn_qty']}, PR: Missing{taxable_value_info})")
-					elif m['type'] == "qty_mismatch":
-						mismatch_parts.append(f"{m['item']} (DN Qty: {m['dn_qty']}, PR Qty: {m['pr_qty']})")
-					elif m['type'] == "taxable_value_mismatch":
-						mismatch_parts.append(f"{m['item']} (DN Taxable Value: ₹{m['dn_taxable_value']:.2f}, PR Taxable Value: ₹{m['pr_taxable_value']:.2f})")
-				
-				if len(all_mismatches) > 5:
-					mismatch_parts.append(f"and {len(all_mismatches) - 5} more items")
-			
-			# Add grand total mismatch
-			if grand_total_mismatch:
-				mismatch_parts.append(f"Grand Total: DN ₹{grand_total_mismatch['dn_total']:.2f} vs PR ₹{grand_total_mismatch['pr_total']:.2f} (Diff: ₹{abs(grand_total_mismatch['diff']):.2f})")
-			
-			# Add tax mismatch (Total Taxes and Charges in company currency)
-			if tax_mismatch:
-				mismatch_parts.append(f"Total Taxes and Charges: DN ₹{tax_mismatch['dn_tax']:.2f} vs PR ₹{tax_mismatch['pr_tax']:.2f} (Diff: ₹{abs(tax_mismatch['diff']):.2f})")
-			
-			if mismatch_parts:
-				mismatch_reason = " | ".join(mismatch_parts)
-				missing_doc = "Purchase Receipt (Mismatch)"
-			else:
-				# No mismatch found, skip this DN
-				continue
-		
-		item_mismatch_str = ""
-		if item_code_mismatches:
-			im_parts = []
-			for im in item_code_mismatches[:3]:
-				im_parts.append(f"DN={im['dn_item_code']}, PR={im['pr_item_code']}")
-			if len(item_code_mismatches) > 3:
-				im_parts.append(f"... +{len(item_code_mismatches) - 3} more")
-			item_mismatch_str = " | ".join(im_parts)
+			""",
+			{"dn_item_names": tuple(dn_item_names)},
+			as_dict=True,
+		) or []
+	except Exception as e:
+		_record_report_error(f"Error checking PR items for DN items: {str(e)}")
+		rows = []
 
-		dn_billing_location = (dn_doc.get("billing_location") or "").strip()
-		pr_location = ""
-		location_mismatch_str = ""
-		if matched_prs:
-			first_pr = list(matched_prs)[0]
-			pr_location = (frappe.db.get_value("Purchase Receipt", first_pr, "location") or "").strip()
-			if dn_billing_location and pr_location and dn_billing_location != pr_location:
-				location_mismatch_str = f"DN={dn_billing_location}, PR={pr_location}"
-
-		mismatches.append({
-			"posting_date": dn.get("posting_date") or None,
-			"document_type": "Delivery Note",
-			"document_name": dn_name,
-			"grand_total": dn.get("grand_total") or 0.0,
-			"company_address_name": dn.get("company_address_name") or "",
-			"customer_address_name": dn.get("customer_address_name") or "",
-			"missing_document": missing_doc,
-			"mismatch_reason": mismatch_reason,
-			"purchase_receipt": purchase_receipt,
-			"purchase_invoice": None,
-			"transfer_chain": "DN->PR",
-			"source_location": dn_billing_location,
-			"purchase_location": pr_location,
-			"location_mismatch": location_mismatch_str,
-			"item_mismatch_details": item_mismatch_str,
-		})
-	
-	return mismatches or []
+	for row in rows:
+		items_by_dn_item[row.get("delivery_note_item")].append(row)
+	return items_by_dn_item
 
 
 def get_sales_invoice_mismatches(filters=None):
@@ -1244,173 +1538,233 @@ def get_sales_invoice_mismatches(filters=None):
 	Returns:
 		list: List of dictionaries with SI mismatch data
 	"""
-	conditions = []
-	values = []
-	
-	# Base conditions - SI with internal customer and different GSTIN
-	conditions.append("c.is_bns_internal_customer = 1")
-	conditions.append("si.docstatus = 1")
-	conditions.append("si.status = 'BNS Internally Transferred'")
-	# Only show SIs where GSTINs differ (different GSTIN flow)
-	conditions.append("(si.company_gstin IS NOT NULL AND si.billing_address_gstin IS NOT NULL AND si.company_gstin != si.billing_address_gstin)")
-	
-	# Add filter conditions
-	if filters:
-		if filters.get("company"):
-			conditions.append("si.company = %s")
-			values.append(filters.company)
-		
-		if filters.get("customer"):
-			conditions.append("si.customer = %s")
-			values.append(filters.customer)
-		
-		if filters.get("company_address"):
-			conditions.append("si.company_address = %s")
-			values.append(filters.company_address)
-		
-		if filters.get("from_date"):
-			conditions.append("si.posting_date >= %s")
-			values.append(filters.from_date)
-		
-		if filters.get("to_date"):
-			conditions.append("si.posting_date <= %s")
-			values.append(filters.to_date)
-	
-	where_clause = " AND ".join(conditions)
-	
+	try:
+		return list(_iter_sales_invoice_mismatches(filters))
+	finally:
+		_flush_report_errors()
+
+
+def _iter_sales_invoice_mismatches(filters=None):
+	"""Yield SI mismatch rows in query order, bulk-loading items per batch."""
+	internal_customers = _get_internal_customers()
+	if not internal_customers:
+		return
+
+	SI = DocType("Sales Invoice")
+
+	si_fields = [
+		SI.posting_date,
+		SI.name,
+		SI.grand_total,
+		SI.net_total,
+		SI.total_taxes_and_charges,
+		SI.base_total_taxes_and_charges,
+		SI.billing_location,
+		SI.bns_inter_company_reference,
+		SI.company_address.as_("company_address_name"),
+		SI.customer_address.as_("customer_address_name"),
+	]
+	if frappe.get_meta("Sales Invoice").has_field("bns_purchase_receipt_reference"):
+		si_fields.append(SI.bns_purchase_receipt_reference)
+
 	# Get all Sales Invoices with internal customers and different GSTIN
-	si_query = """
-		SELECT 
-			si.posting_date,
-			si.name,
-			si.grand_total,
-			si.company_address as company_address_name,
-			si.customer_address as customer_address_name
-		FROM 
-			`tabSales Invoice` si
-		JOIN 
-			`tabCustomer` c ON si.customer = c.name
-		WHERE 
-			""" + where_clause
-	
+	si_query = (
+		frappe.qb.from_(SI)
+		.select(*si_fields)
+		.where(SI.customer.isin(internal_customers))
+		.where(SI.docstatus == 1)
+		.where(SI.status == "BNS Internally Transferred")
+		# Only show SIs where GSTINs differ (different GSTIN flow)
+		.where(
+			SI.company_gstin.isnotnull()
+			& SI.billing_address_gstin.isnotnull()
+			& (SI.company_gstin != SI.billing_address_gstin)
+		)
+	)
+	si_query = _apply_document_filters(si_query, SI, filters)
+	si_query = _apply_ordering(si_query, SI)
+
 	try:
-		si_results = frappe.db.sql(si_query, tuple(values), as_dict=True) or []
+		si_results = si_query.run(as_dict=True) or []
 	except Exception as e:
-		frappe.log_error(f"Error in get_sales_invoice_mismatches: {str(e)}")
+		_record_report_error(f"Error in get_sales_invoice_mismatches: {str(e)}")
 		si_results = []
 	
 	amount_tolerance = _get_si_pi_amount_tolerance()
 
-	mismatches = []
-	for si in si_results:
-		si_name = si.get("name") or ""
-		
-		# Get all Sales Invoice items with taxable values
-		si_items_query = """
-		SELECT 
-			name,
-			item_code,
-			qty,
-			stock_qty,
-			net_amount,
-			base_net_amount,
-			warehouse,
-			delivery_note
-		FROM `tabSales Invoice Item`
-		WHERE parent = %s
-		"""
-		
-		try:
-			si_items = frappe.db.sql(si_items_query, (si_name,), as_dict=True) or []
-		except Exception as e:
-			frappe.log_error(f"Error fetching SI items for {si_name}: {str(e)}")
-			si_items = []
-		
-		if not si_items:
-			# Skip if no items
-			continue
-		
-		# Get Sales Invoice document for totals and taxes
-		si_doc = frappe.get_doc("Sales Invoice", si_name)
-		
-		# Determine chain type: SI->PI or SI->PR->PI
-		has_dn_ref = any((item.get("delivery_note") or "").strip() for item in si_items)
-		si_pr_ref = ""
-		if si_doc.meta.has_field("bns_purchase_receipt_reference"):
-			si_pr_ref = (si_doc.get("bns_purchase_receipt_reference") or "").strip()
-		si_pi_ref = (si_doc.get("bns_inter_company_reference") or "").strip()
-
-		if si_pr_ref and frappe.db.exists("Purchase Receipt", si_pr_ref):
-			chain_type = "DN->SI->PR->PI" if has_dn_ref else "SI->PR->PI"
-		elif si_pi_ref and frappe.db.exists("Purchase Invoice", si_pi_ref):
-			chain_type = "DN->SI->PI" if has_dn_ref else "SI->PI"
-		else:
-			chain_type = "DN->SI->PI" if has_dn_ref else "SI->PI"
+	failures = []
+	first_traceback = None
+	for start in range(0, len(si_results), _ROW_BATCH_SIZE):
+		batch = si_results[start:start + _ROW_BATCH_SIZE]
+
+		si_names = [si.get("name") for si in batch]
+		pi_by_si = _get_pi_by_si_reference(si_names)
+		pi_names = list(set(pi_by_si.values()))
+		pr_refs = list({
+			(si.get("bns_purchase_receipt_reference") or "").strip() for si in batch
+		} - {""})
+		lookups = frappe._dict(
+			pi_by_si=pi_by_si,
+			pi_headers=_get_headers_by_name("Purchase Invoice", pi_names, _PI_HEADER_FIELDS),
+			pi_items_by_parent=_get_pi_items_by_parent(pi_names),
+			si_items_by_parent=_get_si_items_by_parent(si_names),
+			pr_headers=_get_headers_by_name("Purchase Receipt", pr_refs, _PR_HEADER_FIELDS),
+			pr_items_by_parent=_get_pr_items_by_parent(pr_refs),
+		)
+		# SIs billing at least one DN line, for the chain label
+		lookups.si_has_dn_ref = {
+			parent
+			for parent, items in lookups.si_items_by_parent.items()
+			if any((item.get("delivery_note") or "").strip() for item in items)
+		}
 
-		# Check for Purchase Invoice mismatch
-		pi_mismatch = check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance)
-		
-		# Also check SI->PR->PI chain for PR mismatch
-		pr_mismatch_info = _check_si_pr_chain_mismatch(si_name, si_items, si_pr_ref)
-
-		si_billing_location = (si_doc.get("billing_location") or "").strip()
-
-		if pi_mismatch:
-			pi_name_for_loc = pi_mismatch.get("purchase_invoice")
-			pi_location = ""
-			location_mismatch_str = ""
-			if pi_name_for_loc:
-				pi_location = (frappe.db.get_value("Purchase Invoice", pi_name_for_loc, "location") or "").strip()
-				if si_billing_location and pi_location and si_billing_location != pi_location:
-					location_mismatch_str = f"SI={si_billing_location}, PI={pi_location}"
-
-			mismatches.append({
-				"posting_date": si.get("posting_date") or None,
-				"document_type": "Sales Invoice",
-				"document_name": si_name,
-				"grand_total": si.get("grand_total") or 0.0,
-				"company_address_name": si.get("company_address_name") or "",
-				"customer_address_name": si.get("customer_address_name") or "",
-				"missing_document": pi_mismatch.get("missing_doc", "Purchase Invoice"),
-				"mismatch_reason": pi_mismatch.get("reason", "No PI for SI"),
-				"purchase_receipt": pi_mismatch.get("purchase_receipt") or (si_pr_ref if si_pr_ref else None),
-				"purchase_invoice": pi_mismatch.get("purchase_invoice"),
-				"transfer_chain": chain_type,
-				"source_location": si_billing_location,
-				"purchase_location": pi_location,
-				"location_mismatch": location_mismatch_str,
-				"item_mismatch_details": pi_mismatch.get("item_mismatch_details", ""),
-			})
-		elif pr_mismatch_info:
-			pr_location = ""
-			location_mismatch_str = ""
-			if si_pr_ref:
-				pr_location = (frappe.db.get_value("Purchase Receipt", si_pr_ref, "location") or "").strip()
-				if si_billing_location and pr_location and si_billing_location != pr_location:
-					location_mismatch_str = f"SI={si_billing_location}, PR={pr_location}"
-
-			mismatches.append({
-				"posting_date": si.get("posting_date") or None,
-				"document_type": "Sales Invoice",
-				"document_name": si_name,
-				"grand_total": si.get("grand_total") or 0.0,
-				"company_address_name": si.get("company_address_name") or "",
-				"customer_address_name": si.get("customer_address_name") or "",
-				"missing_document": pr_mismatch_info.get("missing_doc", "Purchase Receipt"),
-				"mismatch_reason": pr_mismatch_info.get("reason", ""),
-				"purchase_receipt": si_pr_ref or None,
-				"purchase_invoice": None,
-				"transfer_chain": chain_type,
-				"source_location": si_billing_location,
-				"purchase_location": pr_location,
-				"location_mismatch": location_mismatch_str,
-				"item_mismatch_details": pr_mismatch_info.get("item_mismatch_details", ""),
-			})
+		for si in batch:
+			try:
+				row = _get_si_mismatch_row(
+					si,
+					lookups.si_items_by_parent.get(si.get("name") or "") or [],
+					amount_tolerance,
+					lookups,
+				)
+			except Exception:
+				failures.append(si.get("name"))
+				if len(failures) == 1:
+					first_traceback = frappe.get_traceback()
+				continue
+			if row:
+				yield row
+
+	if failures:
+		_log_row_failures("Sales Invoice", failures, first_traceback)
+
+
+def _get_si_items_by_parent(si_names):
+	"""Fetch Sales Invoice items for all given SIs in one query, keyed by parent."""
+	items_by_parent = defaultdict(list)
+	if not si_names:
+		return items_by_parent
+
+	try:
+		rows = frappe.db.sql(
+			"""
+			SELECT
+				parent,
+				name,
+				item_code,
+				qty,
+				stock_qty,
+				net_amount,
+				base_net_amount,
+				delivery_note
+			FROM `tabSales Invoice Item`
+			WHERE parent IN %(si_names)s
+			ORDER BY parent, idx
+			""",
+			{"si_names": tuple(si_names)},
+			as_dict=True,
+		) or []
+	except Exception as e:
+		_record_report_error(f"Error fetching SI items: {str(e)}")
+		rows = []
+
+	for row in rows:
+		items_by_parent[row.get("parent")].append(row)
+	return items_by_parent
+
+
+def _get_si_mismatch_row(si, si_items, amount_tolerance, lookups):
+	"""Build the report row for one Sales Invoice, or None when its PI/PR chain matches.
+
+	lookups holds the batch's bulk maps (pi_by_si, pi_headers,
+	pi_items_by_parent, pr_headers, pr_items_by_parent) and the
+	si_has_dn_ref set, so no per-row queries are needed.
+	"""
+	si_name = si.get("name") or ""
+
+	if not si_items:
+		# Skip if no items
+		return None
 	
-	return mismatches or []
+	# Determine chain type: SI->PI or SI->PR->PI
+	has_dn_ref = si_name in lookups.si_has_dn_ref
+	si_pr_ref = (si.get("bns_purchase_receipt_reference") or "").strip()
+
+	if si_pr_ref and si_pr_ref in lookups.pr_headers:
+		chain_type = "DN->SI->PR->PI" if has_dn_ref else "SI->PR->PI"
+	else:
+		chain_type = "DN->SI->PI" if has_dn_ref else "SI->PI"
+
+	# Check for Purchase Invoice mismatch
+	pi_mismatch = check_si_pi_mismatch(
+		si_name, si_items, si, amount_tolerance,
+		pi_by_si=lookups.pi_by_si,
+		pi_items_by_parent=lookups.pi_items_by_parent,
+		pi_headers=lookups.pi_headers,
+	)
+	
+	# Also check SI->PR->PI chain for PR mismatch
+	pr_mismatch_info = _check_si_pr_chain_mismatch(
+		si_name, si_items, si_pr_ref, pr_items_by_parent=lookups.pr_items_by_parent
+	)
 
+	si_billing_location = (si.get("billing_location") or "").strip()
+
+	if pi_mismatch:
+		pi_name_for_loc = pi_mismatch.get("purchase_invoice")
+		pi_location = ""
+		location_mismatch_str = ""
+		if pi_name_for_loc:
+			pi_location = ((lookups.pi_headers.get(pi_name_for_loc) or {}).get("location") or "").strip()
+			if si_billing_location and pi_location and si_billing_location != pi_location:
+				location_mismatch_str = f"SI={si_billing_location}, PI={pi_location}"
+
+		return {
+			"posting_date": si.get("posting_date") or None,
+			"document_type": "Sales Invoice",
+			"document_name": si_name,
+			"grand_total": si.get("grand_total") or 0.0,
+			"company_address_name": si.get("company_address_name") or "",
+			"customer_address_name": si.get("customer_address_name") or "",
+			"missing_document": pi_mismatch.get("missing_doc", "Purchase Invoice"),
+			"mismatch_reason": pi_mismatch.get("reason", "No PI for SI"),
+			"purchase_receipt": pi_mismatch.get("purchase_receipt") or (si_pr_ref if si_pr_ref else None),
+			"purchase_invoice": pi_mismatch.get("purchase_invoice"),
+			"transfer_chain": chain_type,
+			"source_location": si_billing_location,
+			"purchase_location": pi_location,
+			"location_mismatch": location_mismatch_str,
+			"item_mismatch_details": pi_mismatch.get("item_mismatch_details", ""),
+		}
+	elif pr_mismatch_info:
+		pr_location = ""
+		location_mismatch_str = ""
+		if si_pr_ref:
+			pr_location = ((lookups.pr_headers.get(si_pr_ref) or {}).get("location") or "").strip()
+			if si_billing_location and pr_location and si_billing_location != pr_location:
+				location_mismatch_str = f"SI={si_billing_location}, PR={pr_location}"
 
-def _check_si_pr_chain_mismatch(si_name, si_items, si_pr_ref):
+		return {
+			"posting_date": si.get("posting_date") or None,
+			"document_type": "Sales Invoice",
+			"document_name": si_name,
+			"grand_total": si.get("grand_total") or 0.0,
+			"company_address_name": si.get("company_address_name") or "",
+			"customer_address_name": si.get("customer_address_name") or "",
+			"missing_document": pr_mismatch_info.get("missing_doc", "Purchase Receipt"),
+			"mismatch_reason": pr_mismatch_info.get("reason", ""),
+			"purchase_receipt": si_pr_ref or None,
+			"purchase_invoice": None,
+			"transfer_chain": chain_type,
+			"source_location": si_billing_location,
+			"purchase_location": pr_location,
+			"location_mismatch": location_mismatch_str,
+			"item_mismatch_details": pr_mismatch_info.get("item_mismatch_details", ""),
+		}
+
+	return None
+
+
+def _check_si_pr_chain_mismatch(si_name, si_items, si_pr_ref, pr_items_by_parent=None):
 	"""
 	Check SI->PR chain for item mismatches.
 
@@ -1418,22 +1772,19 @@ def _check_si_pr_chain_mismatch(si_name, si_items, si_pr_ref):
 		si_name: Sales Invoice name
 		si_items: SI item rows
 		si_pr_ref: bns_purchase_receipt_reference value
+		pr_items_by_parent: optional PR -> items map from _get_pr_items_by_parent;
+			fetched for si_pr_ref alone when not given
 
 	Returns:
 		dict with mismatch info or None
 	"""
-	if not si_pr_ref or not frappe.db.exists("Purchase Receipt", si_pr_ref):
+	if not si_pr_ref:
 		return None
 
-	pr_items = frappe.db.sql(
-		"""
-		SELECT item_code, qty, stock_qty
-		FROM `tabPurchase Receipt Item`
-		WHERE parent = %s
-		""",
-		(si_pr_ref,),
-		as_dict=True,
-	) or []
+	# A PR that does not exist has no items, so it drops out below as well
+	if pr_items_by_parent is None:
+		pr_items_by_parent = _get_pr_items_by_parent([si_pr_ref])
+	pr_items = pr_items_by_parent.get(si_pr_ref) or []
 
 	if not pr_items:
 		return None
@@ -1478,7 +1829,123 @@ def _check_si_pr_chain_mismatch(si_name, si_items, si_pr_ref):
 	}
 
 
-def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
+def _get_headers_by_name(doctype, names, fields):
+	"""Fetch the given header fields for many documents in one query, keyed by name.
+
+	Fields the doctype does not have are skipped and read back as None.
+	"""
+	if not names:
+		return {}
+
+	meta = frappe.get_meta(doctype)
+	rows = frappe.get_all(
+		doctype,
+		filters={"name": ["in", list(names)]},
+		fields=["name", *(f for f in fields if meta.has_field(f))],
+	)
+	return {row.name: row for row in rows}
+
+
+def _get_pr_items_by_parent(pr_names):
+	"""Fetch Purchase Receipt items for all given PRs in one query, keyed by parent."""
+	items_by_parent = defaultdict(list)
+	if not pr_names:
+		return items_by_parent
+
+	rows = frappe.db.sql(
+		"""
+		SELECT parent, item_code, qty, stock_qty
+		FROM `tabPurchase Receipt Item`
+		WHERE parent IN %(pr_names)s
+		""",
+		{"pr_names": tuple(pr_names)},
+		as_dict=True,
+	) or []
+
+	for row in rows:
+		items_by_parent[row.get("parent")].append(row)
+	return items_by_parent
+
+
+def _get_pi_by_si_reference(si_names):
+	"""Map each SI name to its submitted PI (via bns_inter_company_reference) in one query."""
+	if not si_names:
+		return {}
+
+	rows = frappe.db.sql(
+		"""
+		SELECT name, bns_inter_company_reference
+		FROM `tabPurchase Invoice`
+		WHERE docstatus = 1
+		AND bns_inter_company_reference IN %(si_names)s
+		ORDER BY creation
+		""",
+		{"si_names": tuple(si_names)},
+		as_dict=True,
+	) or []
+
+	pi_by_si = {}
+	for row in rows:
+		pi_by_si.setdefault(row.get("bns_inter_company_reference"), row.get("name"))
+	return pi_by_si
+
+
+def _get_pi_items_by_parent(pi_names):
+	"""Fetch Purchase Invoice items for all given PIs in one query, keyed by parent."""
+	items_by_parent = defaultdict(list)
+	if not pi_names:
+		return items_by_parent
+
+	rows = frappe.db.sql(
+		"""
+		SELECT
+			parent,
+			name,
+			item_code,
+			qty,
+			stock_qty,
+			net_amount,
+			base_net_amount,
+			sales_invoice_item
+		FROM `tabPurchase Invoice Item`
+		WHERE parent IN %(pi_names)s
+		ORDER BY parent, idx
+		""",
+		{"pi_names": tuple(pi_names)},
+		as_dict=True,
+	) or []
+
+	for row in rows:
+		items_by_parent[row.get("parent")].append(row)
+	return items_by_parent
+
+
+def _aggregate_items_by_code(items):
+	"""Sum item rows per item_code in one pass.
+
+	Returns:
+		dict: {item_code: (qty, taxable_value)} where taxable_value is the summed
+		base_net_amount, or the summed net_amount when the base total is zero.
+	"""
+	sums = {}
+	for item in items:
+		ic = item.get("item_code") or ""
+		qty, base_net, net = sums.get(ic, (0, 0, 0))
+		sums[ic] = (
+			qty + flt(item.get("qty") or 0),
+			base_net + flt(item.get("base_net_amount") or 0),
+			net + flt(item.get("net_amount") or 0),
+		)
+	return {
+		ic: (qty, base_net if base_net > 0 else net)
+		for ic, (qty, base_net, net) in sums.items()
+	}
+
+
+def check_si_pi_mismatch(
+	si_name, si_items, si_totals, amount_tolerance=0, pi_by_si=None, pi_items_by_parent=None,
+	pi_headers=None,
+):
 	"""
 	Check if Sales Invoice has matching Purchase Invoice.
 	Compares quantities, taxable values, grand totals, and total taxes.
@@ -1487,14 +1954,37 @@ def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
 	Args:
 		si_name: Sales Invoice name
 		si_items: list of SI item dicts
-		si_doc: Sales Invoice document
+		si_totals: Sales Invoice row with grand_total, total_taxes_and_charges
+			and base_total_taxes_and_charges
 		amount_tolerance: maximum allowed absolute difference for amounts (from settings)
+		pi_by_si: optional SI -> PI map from _get_pi_by_si_reference; looked up
+			for this SI alone when not given
+		pi_items_by_parent: optional PI -> items map from _get_pi_items_by_parent;
+			fetched for the matched PI alone when not given
+		pi_headers: optional PI -> totals map from _get_headers_by_name;
+			fetched for the matched PI alone when not given
 
 	Returns:
 		dict: Mismatch information or None if no mismatch
 	"""
+	# Memoised per request: the result only depends on the SI and tolerance
+	memo = _request_cache().setdefault("si_pi", {})
+	key = (si_name, amount_tolerance)
+	if key not in memo:
+		memo[key] = _check_si_pi_mismatch(
+			si_name, si_items, si_totals, amount_tolerance, pi_by_si, pi_items_by_parent, pi_headers
+		)
+	return memo[key]
+
+
+def _check_si_pi_mismatch(
+	si_name, si_items, si_totals, amount_tolerance, pi_by_si, pi_items_by_parent, pi_headers
+):
+	"""Uncached body of check_si_pi_mismatch."""
 	# Check if PI exists via bns_inter_company_reference (BNS internal transfers use this field)
-	pi_name = frappe.db.get_value("Purchase Invoice", {"bns_inter_company_reference": si_name, "docstatus": 1}, "name")
+	if pi_by_si is None:
+		pi_by_si = _get_pi_by_si_reference([si_name])
+	pi_name = pi_by_si.get(si_name)
 	
 	if not pi_name:
 		return {
@@ -1503,19 +1993,31 @@ def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
 			"purchase_invoice": None
 		}
 	
-	# Get PI document for totals and taxes
-	pi_doc = frappe.get_doc("Purchase Invoice", pi_name)
-	pi_grand_total = flt(pi_doc.grand_total or 0)
-	pi_total_taxes = flt(pi_doc.total_taxes_and_charges or 0)
-	pi_base_taxes = flt(pi_doc.base_total_taxes_and_charges or 0)
-	pi_net_total = flt(pi_doc.net_total or 0)
-	
-	# Check quantity, taxable value, and item mismatches
-	missing_items = []
-	qty_mismatches = []
-	taxable_value_mismatches = []
-	extra_items = []
+	# Get PI totals and taxes
+	if pi_headers is None:
+		pi_headers = _get_headers_by_name("Purchase Invoice", [pi_name], _PI_HEADER_FIELDS)
+	pi_totals = pi_headers.get(pi_name) or frappe._dict()
+	pi_grand_total = flt(pi_totals.grand_total or 0)
+	pi_total_taxes = flt(pi_totals.total_taxes_and_charges or 0)
+	pi_base_taxes = flt(pi_totals.base_total_taxes_and_charges or 0)
+	pi_net_total = flt(pi_totals.net_total or 0)
+
+	if pi_items_by_parent is None:
+		pi_items_by_parent = _get_pi_items_by_parent([pi_name])
+	all_pi_items = pi_items_by_parent.get(pi_name) or []
+	pi_items_by_si_item = defaultdict(list)
+	for pi_item in all_pi_items:
+		if pi_item.get("sales_invoice_item"):
+			pi_items_by_si_item[pi_item.get("sales_invoice_item")].append(pi_item)
+
+	# Check quantity, taxable value, and item mismatches. Differences go into
+	# a single (kind, payload) stream in discovery order; past _SI_REASON_LIMIT
+	# entries they are only counted. The flags drive the aggregated fallback.
+	mismatches_stream = []
+	extra_count = 0
+	has_missing = has_extra = has_value_mismatch = False
 	item_code_mismatches_pi = []
+	item_code_mismatch_count = 0
 
 	# Track which PI items are matched
 	matched_pi_items = set()
@@ -1526,34 +2028,21 @@ def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
 		si_stock_qty = flt(si_item.get("stock_qty") or 0)
 		si_net_amount = flt(si_item.get("net_amount") or 0)
 		si_base_net_amount = flt(si_item.get("base_net_amount") or 0)
+		item_code = si_item.get("item_code") or ""
 		
-		# Find Purchase Invoice items linked to this SI item
-		pi_item_query = """
-		SELECT 
-			pii.name,
-			pii.item_code as pi_item_code,
-			pii.qty as pi_qty,
-			pii.stock_qty as pi_stock_qty,
-			pii.net_amount as pi_net_amount,
-			pii.base_net_amount as pi_base_net_amount,
-			pii.warehouse as pi_warehouse
-		FROM `tabPurchase Invoice Item` pii
-		WHERE pii.parent = %s
-		AND pii.sales_invoice_item = %s
-		"""
-		
-		try:
-			pi_items = frappe.db.sql(pi_item_query, (pi_name, si_item_name), as_dict=True) or []
-		except Exception as e:
-			frappe.log_error(f"Error checking PI items for SI item {si_item_name}: {str(e)}")
-			pi_items = []
-		
+		# Purchase Invoice items linked to this SI item
+		pi_items = pi_items_by_si_item.get(si_item_name) or []
+
 		if not pi_items:
-			missing_items.append({
-				"item": si_item.get("item_code") or "",
-				"si_qty": si_qty,
-				"si_taxable_value": si_base_net_amount if si_base_net_amount > 0 else si_net_amount
-			})
+			has_missing = True
+			if len(mismatches_stream) < _SI_REASON_LIMIT:
+				mismatches_stream.append(("missing", {
+					"item": item_code,
+					"si_qty": si_qty,
+					"si_taxable_value": si_base_net_amount if si_base_net_amount > 0 else si_net_amount
+				}))
+			else:
+				extra_count += 1
 		else:
 			# Aggregate quantities and taxable values
 			total_pi_qty = 0
@@ -1563,81 +2052,76 @@ def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
 			
 			for pi_item in pi_items:
 				matched_pi_items.add(pi_item.get("name"))
-				total_pi_qty += flt(pi_item.get("pi_qty") or 0)
-				total_pi_stock_qty += flt(pi_item.get("pi_stock_qty") or 0)
-				total_pi_net_amount += flt(pi_item.get("pi_net_amount") or 0)
-				total_pi_base_net_amount += flt(pi_item.get("pi_base_net_amount") or 0)
+				total_pi_qty += flt(pi_item.get("qty") or 0)
+				total_pi_stock_qty += flt(pi_item.get("stock_qty") or 0)
+				total_pi_net_amount += flt(pi_item.get("net_amount") or 0)
+				total_pi_base_net_amount += flt(pi_item.get("base_net_amount") or 0)
 			
 			# Check quantity match (no tolerance; rounded comparison)
 			if si_stock_qty > 0:
-				if not _qtys_equal(si_stock_qty, total_pi_stock_qty):
-					qty_mismatches.append({
-						"item": si_item.get("item_code") or "",
-						"si_qty": si_stock_qty,
-						"pi_qty": total_pi_stock_qty
-					})
+				si_cmp_qty, pi_cmp_qty = si_stock_qty, total_pi_stock_qty
 			else:
-				if not _qtys_equal(si_qty, total_pi_qty):
-					qty_mismatches.append({
-						"item": si_item.get("item_code") or "",
-						"si_qty": si_qty,
-						"pi_qty": total_pi_qty
-					})
+				si_cmp_qty, pi_cmp_qty = si_qty, total_pi_qty
+			if not _qtys_equal(si_cmp_qty, pi_cmp_qty):
+				has_value_mismatch = True
+				if len(mismatches_stream) < _SI_REASON_LIMIT:
+					mismatches_stream.append(("qty_mismatch", {
+						"item": item_code,
+						"si_qty": si_cmp_qty,
+						"pi_qty": pi_cmp_qty
+					}))
+				else:
+					extra_count += 1
 			
 			si_taxable_value = si_base_net_amount if si_base_net_amount > 0 else si_net_amount
 			pi_taxable_value = total_pi_base_net_amount if total_pi_base_net_amount > 0 else total_pi_net_amount
 			if not _amounts_within_tolerance(si_taxable_value, pi_taxable_value, amount_tolerance):
-				taxable_value_mismatches.append({
-					"item": si_item.get("item_code") or "",
-					"si_taxable_value": si_taxable_value,
-					"pi_taxable_value": pi_taxable_value
-				})
+				has_value_mismatch = True
+				if len(mismatches_stream) < _SI_REASON_LIMIT:
+					mismatches_stream.append(("taxable_value_mismatch", {
+						"item": item_code,
+						"si_taxable_value": si_taxable_value,
+						"pi_taxable_value": pi_taxable_value
+					}))
+				else:
+					extra_count += 1
 
+			si_ic = item_code.strip()
 			for pi_item in pi_items:
-				pi_ic = (pi_item.get("pi_item_code") or "").strip()
-				si_ic = (si_item.get("item_code") or "").strip()
+				pi_ic = (pi_item.get("item_code") or "").strip()
 				if pi_ic and si_ic and pi_ic != si_ic:
-					item_code_mismatches_pi.append({
-						"si_item_code": si_ic,
-						"pi_item_code": pi_ic,
-					})
+					item_code_mismatch_count += 1
+					if item_code_mismatch_count <= _ITEM_CODE_MISMATCH_LIMIT:
+						item_code_mismatches_pi.append((si_ic, pi_ic))
 	
 	# Check for extra items in PI (not linked to any SI item)
-	all_pi_items_query = """
-	SELECT 
-		pii.name,
-		pii.item_code,
-		pii.qty,
-		pii.net_amount,
-		pii.base_net_amount
-	FROM `tabPurchase Invoice Item` pii
-	WHERE pii.parent = %s
-	"""
-	try:
-		all_pi_items = frappe.db.sql(all_pi_items_query, (pi_name,), as_dict=True) or []
-		for pi_item in all_pi_items:
-			if pi_item.get("name") not in matched_pi_items:
-				pi_taxable_value = flt(pi_item.get("base_net_amount") or 0) if flt(pi_item.get("base_net_amount") or 0) > 0 else flt(pi_item.get("net_amount") or 0)
-				extra_items.append({
-					"item": pi_item.get("item_code") or "",
-					"pi_qty": flt(pi_item.get("qty") or 0),
-					"pi_taxable_value": pi_taxable_value
-				})
-	except Exception as e:
-		frappe.log_error(f"Error checking extra PI items: {str(e)}")
-	
+	for pi_item in all_pi_items:
+		if pi_item.get("name") not in matched_pi_items:
+			has_extra = True
+			if len(mismatches_stream) >= _SI_REASON_LIMIT:
+				extra_count += 1
+				continue
+			pi_base_net_amount = flt(pi_item.get("base_net_amount") or 0)
+			pi_taxable_value = pi_base_net_amount if pi_base_net_amount > 0 else flt(pi_item.get("net_amount") or 0)
+			mismatches_stream.append(("extra", {
+				"item": pi_item.get("item_code") or "",
+				"pi_qty": flt(pi_item.get("qty") or 0),
+				"pi_taxable_value": pi_taxable_value
+			}))
+
 	grand_total_mismatch = None
-	if not _amounts_within_tolerance(si_doc.grand_total, pi_grand_total, amount_tolerance):
+	if not _amounts_within_tolerance(si_totals.grand_total, pi_grand_total, amount_tolerance):
 		grand_total_mismatch = {
-			"si_total": flt(si_doc.grand_total or 0),
+			"si_total": flt(si_totals.grand_total or 0),
 			"pi_total": pi_grand_total,
-			"diff": flt(si_doc.grand_total or 0) - pi_grand_total
+			"diff": flt(si_totals.grand_total or 0) - pi_grand_total
 		}
+		grand_total_mismatch["abs_diff"] = abs(grand_total_mismatch["diff"])
 	
 	tax_mismatch = None
-	si_base_taxes = flt(si_doc.base_total_taxes_and_charges or 0)
+	si_base_taxes = flt(si_totals.base_total_taxes_and_charges or 0)
 	if si_base_taxes == 0:
-		si_base_taxes = flt(si_doc.total_taxes_and_charges or 0)
+		si_base_taxes = flt(si_totals.total_taxes_and_charges or 0)
 	if pi_base_taxes == 0:
 		pi_base_taxes = pi_total_taxes
 	
@@ -1647,98 +2131,48 @@ def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
 			"pi_tax": pi_base_taxes,
 			"diff": si_base_taxes - pi_base_taxes
 		}
+		tax_mismatch["abs_diff"] = abs(tax_mismatch["diff"])
 
 	# Fallback: when item-level linking is incomplete (missing/extra items) but no qty/taxable mismatch,
 	# compare by aggregated item_code totals. Ensures explicitly linked SI-PI (e.g. via link_si_pi) with
 	# matching items/qty/taxable value are not falsely reported as mismatch.
-	if (missing_items or extra_items) and not qty_mismatches and not taxable_value_mismatches:
-		all_pi_items_for_agg = frappe.db.sql(all_pi_items_query, (pi_name,), as_dict=True) or []
-		if all_pi_items_for_agg:
-			si_agg = {}
-			for si_item in si_items:
-				ic = si_item.get("item_code") or ""
-				q = flt(si_item.get("qty") or 0)
-				sq = flt(si_item.get("stock_qty") or q)
-				na = flt(si_item.get("net_amount") or 0)
-				bna = flt(si_item.get("base_net_amount") or 0)
-				if ic not in si_agg:
-					si_agg[ic] = {"qty": 0, "stock_qty": 0, "net_amount": 0, "base_net_amount": 0}
-				si_agg[ic]["qty"] += q
-				si_agg[ic]["stock_qty"] += sq
-				si_agg[ic]["net_amount"] += na
-				si_agg[ic]["base_net_amount"] += bna
-			pi_agg = {}
-			for pi_item in all_pi_items_for_agg:
-				ic = pi_item.get("item_code") or ""
-				q = flt(pi_item.get("qty") or 0)
-				na = flt(pi_item.get("net_amount") or 0)
-				bna = flt(pi_item.get("base_net_amount") or 0)
-				if ic not in pi_agg:
-					pi_agg[ic] = {"qty": 0, "net_amount": 0, "base_net_amount": 0}
-				pi_agg[ic]["qty"] += q
-				pi_agg[ic]["net_amount"] += na
-				pi_agg[ic]["base_net_amount"] += bna
-			agg_match = True
-			for ic, s in si_agg.items():
-				if ic not in pi_agg:
-					agg_match = False
-					break
-				p = pi_agg[ic]
-				if not _qtys_equal(s["qty"], p["qty"]):
-					agg_match = False
-					break
-				sv = s["base_net_amount"] if s["base_net_amount"] > 0 else s["net_amount"]
-				pv = p["base_net_amount"] if p["base_net_amount"] > 0 else p["net_amount"]
-				if not _amounts_within_tolerance(sv, pv, amount_tolerance):
-					agg_match = False
-					break
-			for ic in pi_agg:
-				if ic not in si_agg:
-					agg_match = False
-					break
+	if (has_missing or has_extra) and not has_value_mismatch:
+		if all_pi_items:
+			si_agg = _aggregate_items_by_code(si_items)
+			pi_agg = _aggregate_items_by_code(all_pi_items)
+			agg_match = set(si_agg) == set(pi_agg) and all(
+				_qtys_equal(s[0], pi_agg[ic][0])
+				and _amounts_within_tolerance(s[1], pi_agg[ic][1], amount_tolerance)
+				for ic, s in si_agg.items()
+			)
 			if agg_match and not grand_total_mismatch and not tax_mismatch:
 				return None
 
 	# Build mismatch reason
-	if missing_items or qty_mismatches or taxable_value_mismatches or extra_items or grand_total_mismatch or tax_mismatch:
-		all_mismatches = []
-		
-		# Add missing items
-		for item in missing_items:
-			all_mismatches.append(f"{item['item']} (SI Qty: {item['si_qty']}, Taxable Value: ₹{item['si_taxable_value']:.2f}, PI: Missing)")
-		
-		# Add quantity mismatches
-		for mismatch in qty_mismatches:
-			all_mismatches.append(f"{mismatch['item']} (SI Qty: {mismatch['si_qty']}, PI Qty: {mismatch['pi_qty']})")
-		
-		# Add taxable value mismatches
-		for mismatch in taxable_value_mismatches:
-			all_mismatches.append(f"{mismatch['item']} (SI Taxable Value: ₹{mismatch['si_taxable_value']:.2f}, PI Taxable Value: ₹{mismatch['pi_taxable_value']:.2f})")
-		
-		# Add extra items
-		for item in extra_items:
-			all_mismatches.append(f"{item['item']} (Extra in PI: Qty {item['pi_qty']}, Taxable Value ₹{item['pi_taxable_value']:.2f})")
-		
-		# Add grand total mismatch
-		if grand_total_mismatch:
-			all_mismatches.append(f"Grand Total: SI ₹{grand_total_mismatch['si_total']:.2f} vs PI ₹{grand_total_mismatch['pi_total']:.2f} (Diff: ₹{abs(grand_total_mismatch['diff']):.2f})")
-		
-		# Add tax mismatch (Total Taxes and Charges in company currency)
-		if tax_mismatch:
-			all_mismatches.append(f"Total Taxes and Charges: SI ₹{tax_mismatch['si_tax']:.2f} vs PI ₹{tax_mismatch['pi_tax']:.2f} (Diff: ₹{abs(tax_mismatch['diff']):.2f})")
-		
+	for kind, m in (("grand_total", grand_total_mismatch), ("tax", tax_mismatch)):
+		if m:
+			if len(mismatches_stream) < _SI_REASON_LIMIT:
+				mismatches_stream.append((kind, m))
+			else:
+				extra_count += 1
+
+	if mismatches_stream:
+		all_mismatches = [_SI_MISMATCH_FORMATS[kind](**m) for kind, m in mismatches_stream]
+		if extra_count:
+			all_mismatches.append(f"... and {extra_count} more")
+
 		item_mismatch_str = ""
 		if item_code_mismatches_pi:
 			im_parts = []
-			for im in item_code_mismatches_pi[:3]:
-				im_parts.append(f"SI={im['si_item_code']}, PI={im['pi_item_code']}")
-			if len(item_code_mismatches_pi) > 3:
-				im_parts.append(f"... +{len(item_code_mismatches_pi) - 3} more")
+			for si_ic, pi_ic in item_code_mismatches_pi:
+				im_parts.append(f"SI={si_ic}, PI={pi_ic}")
+			if item_code_mismatch_count > _ITEM_CODE_MISMATCH_LIMIT:
+				im_parts.append(f"... +{item_code_mismatch_count - _ITEM_CODE_MISMATCH_LIMIT} more")
 			item_mismatch_str = " | ".join(im_parts)
 
 		return {
 			"missing_doc": "Purchase Invoice (Mismatch)",
-			"reason": " | ".join(all_mismatches[:8]) + (f" | ... and {len(all_mismatches) - 8} more" if len(all_mismatches) > 8 else ""),
+			"reason": " | ".join(all_mismatches),
 			"purchase_invoice": pi_name,
 			"item_mismatch_details": item_mismatch_str,
 		}
@@ -1747,8 +2181,8 @@ def check_si_pi_mismatch(si_name, si_items, si_doc, amount_tolerance=0):
 	if item_code_mismatches_pi:
 		item_mismatch_str = ""
 		im_parts = []
-		for im in item_code_mismatches_pi[:3]:
-			im_parts.append(f"SI={im['si_item_code']}, PI={im['pi_item_code']}")
+		for si_ic, pi_ic in item_code_mismatches_pi:
+			im_parts.append(f"SI={si_ic}, PI={pi_ic}")
 		item_mismatch_str = " | ".join(im_parts)
 
 		return {
@@ -260,16 +260,15 @@ def _get_paired_prs(pr_names: list) -> set:
 	"""Return set of PR names that have at least one submitted PI linked."""
 	if not pr_names:
 		return set()
-	placeholders = ", ".join(["%s"] * len(pr_names))
 	rows = frappe.db.sql(
-		f"""
+		"""
 		SELECT DISTINCT pii.purchase_receipt
 		FROM `tabPurchase Invoice Item` pii
 		INNER JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent AND pi.docstatus = 1
-		WHERE pii.purchase_receipt IN ({placeholders})
+		WHERE pii.purchase_receipt IN %(pr_names)s
 		  AND IFNULL(pii.purchase_receipt, '') != ''
 		""",
-		tuple(pr_names),
+		{"pr_names": tuple(pr_names)},
 		as_dict=False,
 	)
 	return {r[0] for r in rows if r[0]}
@@ -279,15 +278,14 @@ def _get_pis_with_pr_link(pi_names: list) -> set:
 	"""Return set of PI names that have at least one item with a purchase_receipt link."""
 	if not pi_names:
 		return set()
-	placeholders = ", ".join(["%s"] * len(pi_names))
 	rows = frappe.db.sql(
-		f"""
+		"""
 		SELECT DISTINCT parent
 		FROM `tabPurchase Invoice Item`
-		WHERE parent IN ({placeholders})
+		WHERE parent IN %(pi_names)s
 		  AND IFNULL(purchase_receipt, '') != ''
 		""",
-		tuple(pi_names),
+		{"pi_names": tuple(pi_names)},
 		as_dict=False,
 	)
 	return {r[0] for r in rows if r[0]}
@@ -305,14 +303,13 @@ def _get_bns_internal_prs(pr_names: list) -> set:
 	"""Return set of PR names that are BNS internal transfers."""
 	if not pr_names:
 		return set()
-	placeholders = ", ".join(["%s"] * len(pr_names))
 	rows = frappe.db.sql(
-		f"""
+		"""
 		SELECT name FROM `tabPurchase Receipt`
-		WHERE name IN ({placeholders})
+		WHERE name IN %(pr_names)s
 		  AND is_bns_internal_supplier = 1
 		""",
-		tuple(pr_names),
+		{"pr_names": tuple(pr_names)},
 		as_dict=False,
 	)
 	return {r[0] for r in rows if r[0]}
@@ -366,18 +363,17 @@ def build_internal_srbnb_clearing_je(
 		return {"error": "No clearing account found. Set 'Internal Transfer SRBNB Clearing Account' in BNS Settings."}
 
 	# Compute total SRBNB credit for these PRs
-	placeholders = ", ".join(["%s"] * len(pr_names))
 	rows = frappe.db.sql(
-		f"""
+		"""
 		SELECT SUM(credit) - SUM(debit) AS net_credit
 		FROM `tabGL Entry`
-		WHERE account = %s
-		  AND company = %s
+		WHERE account = %(account)s
+		  AND company = %(company)s
 		  AND is_cancelled = 0
 		  AND voucher_type = 'Purchase Receipt'
-		  AND voucher_no IN ({placeholders})
+		  AND voucher_no IN %(pr_names)s
 		""",
-		[srbnb_account, company] + list(pr_names),
+		{"account": srbnb_account, "company": company, "pr_names": tuple(pr_names)},
 		as_dict=True,
 	)
 	total = flt(rows[0].net_credit) if rows and rows[0].net_credit else 0
@@ -0,0 +1,78 @@
+# Copyright (c) 2026, Sagar Ratan Garg and Contributors
+# License: Commercial
+
+"""
+Tests for the taxable-value fallback in Internal Transfer Receive Mismatch.
+
+Return documents carry a zero or negative base_net_amount, so the report
+compares their net_amount instead. Uses FrappeTestCase like the other tests in
+this module; the item rows are built in the shape the report's queries return.
+"""
+
+from __future__ import annotations
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from business_needed_solutions.bns_branch_accounting.report.internal_transfer_receive_mismatch import (
+	internal_transfer_receive_mismatch as itrm,
+)
+
+
+def _return_item(name, base_net_amount=0, net_amount=-150.0, **extra):
+	row = frappe._dict(
+		name=name,
+		item_code="ITEM-1",
+		qty=-2,
+		stock_qty=-2,
+		net_amount=net_amount,
+		base_net_amount=base_net_amount,
+	)
+	row.update(extra)
+	return row
+
+
+def _pr_totals(dn_item_name, net_amount, base_net_amount=0):
+	pr_item = frappe._dict(
+		pr_qty=-2,
+		pr_stock_qty=-2,
+		pr_net_amount=net_amount,
+		pr_base_net_amount=base_net_amount,
+	)
+	return itrm._sum_pr_items_by_dn_item({dn_item_name: [pr_item]})
+
+
+class TestReturnRowTaxableValue(FrappeTestCase):
+	def test_aggregate_falls_back_to_net_amount_without_base(self):
+		items = [_return_item("PII-1"), _return_item("PII-2", net_amount=-50.0)]
+		self.assertEqual(itrm._aggregate_items_by_code(items), {"ITEM-1": (-4, -200.0)})
+
+	def test_aggregate_prefers_positive_base_net_amount(self):
+		items = [_return_item("PII-1", base_net_amount=120.0, net_amount=100.0, qty=2)]
+		self.assertEqual(itrm._aggregate_items_by_code(items), {"ITEM-1": (2, 120.0)})
+
+	def test_joined_dn_rows_keep_return_net_amount(self):
+		rows = [
+			frappe._dict(
+				name="DN-RET-1",
+				dn_item_name="DNI-1",
+				item_code="ITEM-1",
+				qty=-2,
+				stock_qty=-2,
+				net_amount=-150.0,
+				base_net_amount=0,
+			)
+		]
+		headers, items_by_parent = itrm._split_dn_item_rows(rows)
+		self.assertEqual([h.name for h in headers], ["DN-RET-1"])
+		self.assertEqual(items_by_parent["DN-RET-1"][0].net_amount, -150.0)
+
+	def test_matching_return_pair_has_no_diff(self):
+		dn_items_by_parent = {"DN-RET-1": [_return_item("DNI-1")]}
+		diffs = itrm._find_dn_item_diffs(dn_items_by_parent, _pr_totals("DNI-1", -150.0))
+		self.assertEqual(diffs, {})
+
+	def test_return_taxable_value_mismatch_is_reported(self):
+		dn_items_by_parent = {"DN-RET-1": [_return_item("DNI-1")]}
+		diffs = itrm._find_dn_item_diffs(dn_items_by_parent, _pr_totals("DNI-1", -100.0))
+		self.assertEqual(diffs, {"DNI-1": (None, (-150.0, -100.0))})
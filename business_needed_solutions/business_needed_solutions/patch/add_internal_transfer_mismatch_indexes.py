@@ -0,0 +1,22 @@
+import frappe
+
+
+INDEXES = [
+    ("Delivery Note", ["docstatus", "posting_date", "company"]),
+    ("Sales Invoice", ["docstatus", "status", "posting_date", "company"]),
+    ("Purchase Receipt Item", ["delivery_note_item"]),
+    ("Purchase Invoice Item", ["sales_invoice_item", "parent"]),
+    ("Purchase Invoice", ["bns_inter_company_reference"]),
+    ("Purchase Invoice", ["inter_company_invoice_reference"]),
+]
+
+
+def execute():
+    """Index the DN/SI date filters and the PR/PI back-links to the sending
+    document used by the Internal Transfer Receive Mismatch report."""
+    for doctype, fields in INDEXES:
+        # Custom fields (bns_*) may not be synced yet on a fresh site.
+        if not all(frappe.db.has_column(doctype, field) for field in fields):
+            continue
+        frappe.db.add_index(doctype, fields)
+    frappe.db.commit()
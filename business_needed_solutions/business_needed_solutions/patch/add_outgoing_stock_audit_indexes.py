@@ -0,0 +1,18 @@
+import frappe
+
+
+INDEXES = [
+    ("Sales Invoice", ["docstatus", "posting_date", "company"]),
+    ("Purchase Invoice", ["docstatus", "posting_date", "company"]),
+    ("Delivery Note", ["docstatus", "posting_date", "company"]),
+    ("Purchase Receipt", ["docstatus", "posting_date", "company"]),
+    ("Stock Ledger Entry", ["voucher_detail_no", "is_cancelled"]),
+]
+
+
+def execute():
+    """Index the voucher date filters and the SLE voucher_detail_no lookup
+    behind the Outgoing Stock Audit - 1 BNS report."""
+    for doctype, fields in INDEXES:
+        frappe.db.add_index(doctype, fields)
+    frappe.db.commit()
@@ -0,0 +1,10 @@
+import frappe
+
+
+def execute():
+    """Index GL Entry on company + posting_date + is_cancelled, the range
+    Party GL scans before it applies the party filters."""
+    frappe.db.add_index(
+        "GL Entry", ["company", "posting_date", "is_cancelled"], "idx_gle_company_posting_date"
+    )
+    frappe.db.commit()
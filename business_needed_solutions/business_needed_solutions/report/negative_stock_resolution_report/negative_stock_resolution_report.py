@@ -1,6 +1,8 @@
 # Copyright (c) 2025, Sagar Ratan Garg and contributors
 # For license information, please see license.txt
 
+from collections import defaultdict
+
 import frappe
 from frappe import _
 from frappe.utils import flt
@@ -90,17 +92,44 @@ def get_data(filters):
         return []
         
     episodes = find_negative_episodes(stock_ledger_data)
-    
+
+    # Prefetch default BOMs, their components and the Bin rows for every
+    # episode item and component, so episodes are analysed from memory.
+    episode_items = {ep.get("item_code") for ep in episodes if ep.get("item_code")}
+    item_info = {
+        row.name: row
+        for row in frappe.get_all(
+            "Item",
+            filters={"name": ["in", list(episode_items)]},
+            fields=["name", "stock_uom", "is_purchase_item"]
+        )
+    } if episode_items else {}
+    default_boms = get_default_boms(episode_items)
+    bom_items_by_parent = get_bom_items_by_parent([bom.name for bom in default_boms.values()])
+    bin_map, bins_by_item = get_bin_snapshot(
+        episode_items
+        | {row.item_code for rows in bom_items_by_parent.values() for row in rows}
+    )
+
     # Process each episode to add resolution suggestions
     resolution_data = []
     for episode in episodes:
-        resolution = analyze_episode(episode)
+        resolution = analyze_episode(
+            episode,
+            item_info=item_info,
+            default_boms=default_boms,
+            bom_items_by_parent=bom_items_by_parent,
+            bin_map=bin_map,
+            bins_by_item=bins_by_item,
+        )
         if resolution:
             resolution_data.append(resolution)
     
     return resolution_data
 
-def analyze_episode(episode):
+def analyze_episode(
+    episode, item_info=None, default_boms=None, bom_items_by_parent=None, bin_map=None, bins_by_item=None
+):
     item_code = episode.get("item_code")
     warehouse = episode.get("warehouse")
     min_qty = abs(episode.get("min_balance", 0))
@@ -109,9 +138,15 @@ def analyze_episode(episode):
     if not (item_code and warehouse and min_qty and stock_uom):
         return None
     
-    try:
-        item = frappe.get_doc("Item", item_code)
-    except frappe.DoesNotExistError:
+    # Only stock_uom and is_purchase_item are needed, so read those fields
+    # (prefetched for all episodes by get_data) instead of the Item document
+    if item_info is None:
+        item = frappe.db.get_value(
+            "Item", item_code, ["stock_uom", "is_purchase_item"], as_dict=True
+        )
+    else:
+        item = item_info.get(item_code)
+    if not item:
         frappe.msgprint(_("Item {0} not found").format(item_code))
         return None
         
@@ -133,24 +168,34 @@ def analyze_episode(episode):
     }
     
     # Check for active BOM first as preferred solution
-    default_bom = get_default_bom(item_code)
+    if default_boms is None:
+        default_bom = get_default_bom(item_code)
+        bom_header = bom_items = None
+    else:
+        bom_header = default_boms.get(item_code)
+        default_bom = bom_header.name if bom_header else None
+        bom_items = (bom_items_by_parent or {}).get(default_bom, [])
     
     if default_bom:
         resolution["bom_check"] = "Yes"
-        bom_analysis = analyze_bom_availability(default_bom, min_qty, warehouse)
+        bom_analysis = analyze_bom_availability(
+            default_bom, min_qty, warehouse, bin_map=bin_map, bom=bom_header, bom_items=bom_items
+        )
         resolution["bom_status"] = bom_analysis["status"]
         
         if bom_analysis["can_produce"]:
             resolution["suggested_fix"] = "Produce via BOM"
             return resolution
         elif bom_analysis["partial_qty"] > 0:
-            resolution["suggested_fix"] = f"Partial production possible ({flt(bom_analysis['partial_qty'], 2)} {item.stock_uom or frappe.db.get_value('Item', item_code, 'stock_uom')})"
+            resolution["suggested_fix"] = f"Partial production possible ({flt(bom_analysis['partial_qty'], 2)} {item.stock_uom or _get_item_stock_uom(item_code)})"
             return resolution
     
     # If BOM not possible or not available, check other options
     if item.is_purchase_item:
         # Check other warehouses first
-        alt_warehouse = find_alternative_warehouse(item_code, min_qty, warehouse)
+        alt_warehouse = find_alternative_warehouse(
+            item_code, min_qty, warehouse, bins_by_item=bins_by_item
+        )
         if alt_warehouse:
             resolution["alternative_warehouse"] = alt_warehouse
             resolution["suggested_fix"] = "Stock transfer"
@@ -178,30 +223,93 @@ def get_default_bom(item_code):
     )
     return bom[0].name if bom else None
 
-def analyze_bom_availability(bom_no, required_qty, warehouse):
+def get_default_boms(item_codes):
+    """Map each item to its default active BOM header (name, item, uom, quantity) in one query"""
+    if not item_codes:
+        return {}
+
+    boms = frappe.get_all(
+        "BOM",
+        filters={
+            "item": ["in", list(item_codes)],
+            "is_active": 1,
+            "is_default": 1
+        },
+        fields=["name", "item", "uom", "quantity"]
+    )
+    default_boms = {}
+    for bom in boms:
+        default_boms.setdefault(bom.item, bom)
+    return default_boms
+
+def get_bom_items_by_parent(bom_names):
+    """Fetch BOM Item rows for all given BOMs in one query, grouped by BOM"""
+    items_by_parent = defaultdict(list)
+    if not bom_names:
+        return items_by_parent
+
+    rows = frappe.get_all(
+        "BOM Item",
+        filters={"parent": ["in", list(bom_names)], "parenttype": "BOM"},
+        fields=["parent", "item_code", "stock_qty"],
+        order_by="parent, idx"
+    )
+    for row in rows:
+        items_by_parent[row.parent].append(row)
+    return items_by_parent
+
+def get_bin_snapshot(item_codes):
+    """
+    Read all Bin rows for the given items in one query.
+
+    Returns (bin_map, bins_by_item): actual_qty keyed by (item_code, warehouse),
+    and per-item (warehouse, actual_qty) lists sorted by actual_qty descending.
+    """
+    bin_map = {}
+    bins_by_item = defaultdict(list)
+    if not item_codes:
+        return bin_map, bins_by_item
+
+    bins = frappe.get_all(
+        "Bin",
+        filters={"item_code": ["in", list(item_codes)]},
+        fields=["item_code", "warehouse", "actual_qty"],
+        order_by="actual_qty desc"
+    )
+    for b in bins:
+        bin_map[(b.item_code, b.warehouse)] = flt(b.actual_qty)
+        bins_by_item[b.item_code].append((b.warehouse, flt(b.actual_qty)))
+    return bin_map, bins_by_item
+
+def analyze_bom_availability(bom_no, required_qty, warehouse, bin_map=None, bom=None, bom_items=None):
     """
     Analyze if BOM items are available in stock.
     All quantities are converted to respective stock UOMs for accurate comparison.
+    bin_map (from get_bin_snapshot) replaces the per-component Bin lookups, and a
+    prefetched bom header/bom_items pair replaces loading the BOM document.
     """
-    bom = frappe.get_doc("BOM", bom_no)
+    if bom is None or bom_items is None:
+        bom = frappe.get_doc("BOM", bom_no)
+        bom_items = bom.items
     all_available = True
     partial_available = False
     max_possible_qty = float('inf')
     shortage_items = []
     
     # Get item's stock UOM
-    item_stock_uom = frappe.db.get_value("Item", bom.item, "stock_uom")
+    item_stock_uom = _get_item_stock_uom(bom.item)
     
     # Convert required_qty to item's stock UOM if different
     if bom.uom != item_stock_uom:
         required_qty = convert_to_stock_qty(required_qty, bom.uom, item_stock_uom, bom.item)
     
-    for item in bom.items:
+    bom_quantity = bom.quantity
+    for item in bom_items:
         # Calculate required quantity in item's stock UOM
-        required_item_qty = (required_qty * item.stock_qty) / bom.quantity
+        required_item_qty = (required_qty * item.stock_qty) / bom_quantity
         
         # Get available quantity in stock UOM
-        bin_qty = get_bin_qty(item.item_code, warehouse)
+        bin_qty = get_bin_qty(item.item_code, warehouse, bin_map=bin_map)
         
         if bin_qty < required_item_qty:
             all_available = False
@@ -213,7 +321,7 @@ def analyze_bom_availability(bom_no, required_qty, warehouse):
             })
             
             # Calculate maximum possible quantity based on this component
-            possible_qty = (bin_qty * bom.quantity) / item.stock_qty
+            possible_qty = (bin_qty * bom_quantity) / item.stock_qty
             max_possible_qty = min(max_possible_qty, possible_qty)
         else:
             partial_available = True
@@ -229,16 +337,32 @@ def analyze_bom_availability(bom_no, required_qty, warehouse):
         "shortages": shortage_items
     }
 
+def _get_item_stock_uom(item_code):
+    """Item stock UOM via Frappe's document cache (cleared when the Item is saved)."""
+    return frappe.get_cached_value("Item", item_code, "stock_uom")
+
+def _get_conversion_factor(item_code, from_uom):
+    """UOM Conversion Detail factor for (item_code, from_uom), memoised per request."""
+    cache = frappe.local.flags.get("_bns_uom_factor_cache")
+    if cache is None:
+        cache = {}
+        frappe.local.flags["_bns_uom_factor_cache"] = cache
+
+    key = (item_code, from_uom)
+    if key not in cache:
+        cache[key] = frappe.db.get_value(
+            "UOM Conversion Detail",
+            {"parent": item_code, "uom": from_uom},
+            "conversion_factor"
+        )
+    return cache[key]
+
 def convert_to_stock_qty(qty, from_uom, to_uom, item_code):
     """Convert quantity from one UOM to another"""
     if from_uom == to_uom:
         return qty
         
-    conversion_factor = frappe.db.get_value(
-        "UOM Conversion Detail",
-        {"parent": item_code, "uom": from_uom},
-        "conversion_factor"
-    )
+    conversion_factor = _get_conversion_factor(item_code, from_uom)
     
     if not conversion_factor:
         frappe.throw(_("UOM Conversion factor not found for item {0} from {1} to {2}").format(
@@ -247,12 +371,13 @@ def convert_to_stock_qty(qty, from_uom, to_uom, item_code):
     
     return flt(qty * conversion_factor)
 
-def get_bin_qty(item_code, warehouse, uom=None, batch_no=None):
+def get_bin_qty(item_code, warehouse, uom=None, batch_no=None, bin_map=None):
     """
     Get actual stock quantity in specified UOM.
 
     When batch_no is provided, computes qty from Stock Ledger Entries
-    since the Bin doctype does not track batch-level balances.
+    since the Bin doctype does not track batch-level balances. Otherwise a
+    prefetched bin_map (from get_bin_snapshot) is used when given.
     """
     if batch_no:
         bin_qty = flt(
@@ -267,6 +392,8 @@ def get_bin_qty(item_code, warehouse, uom=None, batch_no=None):
             )[0][0]
             or 0
         )
+    elif bin_map is not None:
+        bin_qty = bin_map.get((item_code, warehouse), 0)
     else:
         bin_qty = frappe.db.get_value(
             "Bin",
@@ -275,18 +402,19 @@ def get_bin_qty(item_code, warehouse, uom=None, batch_no=None):
         ) or 0
 
     if uom:
-        item_stock_uom = frappe.db.get_value("Item", item_code, "stock_uom")
+        item_stock_uom = _get_item_stock_uom(item_code)
         if uom != item_stock_uom:
             bin_qty = convert_to_stock_qty(bin_qty, item_stock_uom, uom, item_code)
 
     return flt(bin_qty)
 
-def find_alternative_warehouse(item_code, required_qty, current_warehouse, batch_no=None):
+def find_alternative_warehouse(item_code, required_qty, current_warehouse, batch_no=None, bins_by_item=None):
     """
     Find alternative warehouse with sufficient stock.
 
     When batch_no is provided, queries SLE aggregates instead of the Bin
-    doctype to find warehouses with batch-level availability.
+    doctype to find warehouses with batch-level availability. Otherwise a
+    prefetched bins_by_item (from get_bin_snapshot) is used when given.
     """
     if batch_no:
         rows = frappe.db.sql(
@@ -305,6 +433,13 @@ def find_alternative_warehouse(item_code, required_qty, current_warehouse, batch
         )
         return rows[0].warehouse if rows else ""
 
+    if bins_by_item is not None:
+        # Sorted by actual_qty descending: the first other warehouse is the best
+        for warehouse, actual_qty in bins_by_item.get(item_code, ()):
+            if warehouse != current_warehouse:
+                return warehouse if actual_qty >= required_qty else ""
+        return ""
+
     bins = frappe.get_all(
         "Bin",
         filters={
@@ -15,11 +15,13 @@ corrections or grade slabs.
 Note: Uses net_rate (excluding GST) from child tables for accurate rate comparison.
 """
 
+import heapq
+from operator import itemgetter
+
 import frappe
 from frappe import _
-from frappe.utils import flt, getdate
+from frappe.utils import getdate
 from frappe.query_builder import DocType
-from collections import defaultdict
 
 
 def execute(filters=None):
@@ -31,7 +33,7 @@ def execute(filters=None):
 		
 	Returns:
 		tuple: (columns, data) where columns is list of column definitions
-		       and data is list of dictionaries containing report data
+		       and data is list of rows (value lists in column order)
 	"""
 	if not filters:
 		filters = {}
@@ -48,31 +50,30 @@ def execute(filters=None):
 		frappe.msgprint(_("No items found matching the filters"))
 		return get_columns(), []
 	
+	# Cheap probe: nothing can be flagged without stock ledger activity
+	if not has_stock_ledger_entries(filters, items):
+		return get_columns(), []
+	
 	# Get voucher items
 	voucher_items = get_voucher_items(filters, items)
 	if not voucher_items:
 		return get_columns(), []
 	
 	# Bulk fetch SLE data
-	sle_data = get_sle_data_bulk(voucher_items, items)
+	sle_data = get_sle_data_bulk(voucher_items)
 	
-	# Build report data by matching vouchers with SLE
+	# Build the flagged report rows by matching vouchers with SLE; rows
+	# keep the posting_date, voucher_no order of get_voucher_items
 	data = build_report_data(voucher_items, sle_data)
 	
-	# Filter out rows with no errors (both flags = 0)
-	data = [row for row in data if row.get("is_negative_stock") == 1 or row.get("is_sale_below_valuation") == 1]
-	
-	# Sort by posting_date ascending, then voucher_no
-	data.sort(key=lambda x: (
-		getdate(x.get("posting_date") or "1900-01-01"),
-		x.get("voucher_no", "")
-	))
-	
 	return get_columns(), data
 
 
 def get_columns():
-	"""Define report columns."""
+	"""Define report columns.
+	
+	build_report_data emits row values in this column order.
+	"""
 	return [
 		{
 			"label": _("Posting Date"),
@@ -188,24 +189,43 @@ def get_items(filters):
 	"""
 	Get list of item codes based on filters.
 	
+	The result depends only on the item group and item code filters, so it
+	is memoised per request for each filter combination.
+	
 	Args:
 		filters: Report filters dictionary
 		
 	Returns:
 		list: List of item codes
 	"""
+	item_codes = filters.get("item_code") or []
+	if isinstance(item_codes, str):
+		item_codes = [item_codes]
+	item_codes = tuple(sorted(item_codes))
+	item_group = filters.get("item_group") or ""
+	
+	cache = frappe.local.flags.get("_bns_outgoing_stock_audit_items")
+	if cache is None:
+		cache = {}
+		frappe.local.flags["_bns_outgoing_stock_audit_items"] = cache
+
+	key = (item_group, item_codes)
+	if key not in cache:
+		cache[key] = _get_items(item_group, item_codes)
+	return cache[key]
+
+
+def _get_items(item_group, item_codes):
+	"""Query the stock item codes for an item group and/or item code list."""
 	Item = DocType("Item")
 	query = frappe.qb.from_(Item).select(Item.name)
 	
 	# Filter by item group if provided
-	if filters.get("item_group"):
-		query = query.where(Item.item_group == filters.item_group)
+	if item_group:
+		query = query.where(Item.item_group == item_group)
 	
 	# Filter by specific item codes if provided
-	if filters.get("item_code"):
-		item_codes = filters.item_code
-		if isinstance(item_codes, str):
-			item_codes = [item_codes]
+	if item_codes:
 		query = query.where(Item.name.isin(item_codes))
 	
 	# Only stock items
@@ -215,16 +235,50 @@ def get_items(filters):
 	return [row.name for row in results]
 
 
+# Largest IN-list bound into a single statement
+_IN_CHUNK_SIZE = 1000
+
+# (parent doctype, child doctype) per voucher branch, in fetch order
+_VOUCHER_DOCTYPES = (
+	("Sales Invoice", "Sales Invoice Item"),
+	("Purchase Invoice", "Purchase Invoice Item"),
+	("Delivery Note", "Delivery Note Item"),
+	("Purchase Receipt", "Purchase Receipt Item"),
+)
+
+# Voucher types checked for sale below valuation
+_SALE_VOUCHER_DOCTYPES = frozenset({"Sales Invoice", "Delivery Note"})
+
+# Extra SLE predicate for sale voucher branches (see build_report_data)
+_SALE_BELOW_VALUATION_CONDITION = """
+						OR (
+							COALESCE(parent.is_return, 0) = 0
+							AND child.net_rate != 0
+							AND sle.valuation_rate > 0
+							AND child.net_rate < sle.valuation_rate
+						)"""
+
+
 def get_voucher_items(filters, items):
 	"""
 	Fetch voucher items (SI/PI/DN/PR) for items in the date range.
 	
+	All included doctypes are read in one UNION ALL query; each branch
+	tags its rows with a constant voucher_type. net_rate is the child
+	row's rate excluding GST (selling rate for SI/DN).
+	
+	Only rows that can be flagged are returned: the row must have an SLE
+	posting into negative stock or, for non-return SI/DN rows, one whose
+	valuation rate exceeds the selling rate. build_report_data still
+	decides the exact flags from the latest SLE.
+	
 	Args:
 		filters: Report filters dictionary
 		items: List of item codes
 		
 	Returns:
-		list: List of dictionaries containing voucher item data
+		list: List of dictionaries containing voucher item data, ordered by
+		      posting_date then voucher_no
 	"""
 	if not items:
 		return []
@@ -232,268 +286,182 @@ def get_voucher_items(filters, items):
 	include_doctypes = filters.get("include_doctypes", [])
 	if isinstance(include_doctypes, str):
 		include_doctypes = [include_doctypes]
-	if not include_doctypes:
-		include_doctypes = ["Sales Invoice", "Purchase Invoice"]
-	
-	voucher_items = []
-	from_date = getdate(filters.from_date)
-	to_date = getdate(filters.to_date)
-	
-	# Get Sales Invoice Items
-	if "Sales Invoice" in include_doctypes:
-		si_items = get_sales_invoice_items(filters, items, from_date, to_date)
-		voucher_items.extend(si_items)
-	
-	# Get Purchase Invoice Items
-	if "Purchase Invoice" in include_doctypes:
-		pi_items = get_purchase_invoice_items(filters, items, from_date, to_date)
-		voucher_items.extend(pi_items)
-	
-	# Get Delivery Note Items
-	if "Delivery Note" in include_doctypes:
-		dn_items = get_delivery_note_items(filters, items, from_date, to_date)
-		voucher_items.extend(dn_items)
-	
-	# Get Purchase Receipt Items
-	if "Purchase Receipt" in include_doctypes:
-		pr_items = get_purchase_receipt_items(filters, items, from_date, to_date)
-		voucher_items.extend(pr_items)
-	
-	return voucher_items
-
-
-def get_sales_invoice_items(filters, items, from_date, to_date):
-	"""Get Sales Invoice items - using net_rate (excluding GST)."""
-	SI = DocType("Sales Invoice")
-	SII = DocType("Sales Invoice Item")
-	
-	query = (
-		frappe.qb.from_(SI)
-		.join(SII).on(SI.name == SII.parent)
-		.select(
-			SII.name.as_("voucher_detail_no"),
-			SI.posting_date,
-			SI.posting_time,
-			SI.name.as_("voucher_no"),
-			SII.item_code,
-			SII.item_name,
-			SII.warehouse,
-			SII.stock_qty,
-			SII.stock_uom,
-			SII.net_rate.as_("selling_rate"),  # Use net_rate (excluding GST)
-			SI.owner,
-			SI.company,
-			SI.is_return
-		)
-		.where(
-			(SI.docstatus == 1) &
-			(SI.posting_date[from_date:to_date]) &
-			(SII.item_code.isin(items)) &
-			(SI.company == filters.company)
-		)
-	)
-	
-	# Apply warehouse filter if provided
+	include_doctypes = frozenset(include_doctypes or ("Sales Invoice", "Purchase Invoice"))
+	
+	values = {
+		"company": filters.company,
+		"from_date": getdate(filters.from_date),
+		"to_date": getdate(filters.to_date),
+	}
+	warehouse_condition = ""
 	if filters.get("warehouse"):
-		query = query.where(SII.warehouse == filters.warehouse)
+		warehouse_condition = "AND child.warehouse = %(warehouse)s"
+		values["warehouse"] = filters.warehouse
+	
+	branches = [
+		f"""
+		SELECT
+			child.name AS voucher_detail_no,
+			parent.posting_date,
+			parent.name AS voucher_no,
+			'{doctype}' AS voucher_type,
+			child.item_code,
+			child.item_name,
+			child.warehouse,
+			child.stock_qty,
+			child.stock_uom,
+			child.net_rate,
+			parent.owner,
+			{"parent.is_return" if doctype in _SALE_VOUCHER_DOCTYPES else "0"} AS is_return
+		FROM `tab{doctype}` parent
+		JOIN `tab{child_doctype}` child ON child.parent = parent.name
+		WHERE parent.docstatus = 1
+			AND parent.posting_date BETWEEN %(from_date)s AND %(to_date)s
+			AND parent.company = %(company)s
+			AND child.item_code IN %(items)s
+			{warehouse_condition}
+			AND EXISTS (
+				SELECT 1
+				FROM `tabStock Ledger Entry` sle
+				WHERE sle.voucher_detail_no = child.name
+					AND sle.voucher_type = '{doctype}'
+					AND sle.voucher_no = parent.name
+					AND sle.item_code = child.item_code
+					AND sle.warehouse = child.warehouse
+					AND sle.is_cancelled = 0
+					AND (
+						sle.qty_after_transaction < 0
+						{_SALE_BELOW_VALUATION_CONDITION if doctype in _SALE_VOUCHER_DOCTYPES else ""}
+					)
+			)
+		"""
+		for doctype, child_doctype in _VOUCHER_DOCTYPES
+		if doctype in include_doctypes
+	]
+	if not branches:
+		return []
 	
-	results = query.run(as_dict=True)
-	# Add voucher_type in Python
-	for row in results:
-		row["voucher_type"] = "Sales Invoice"
-	return results
-
-
-def get_purchase_invoice_items(filters, items, from_date, to_date):
-	"""Get Purchase Invoice items - using net_rate (excluding GST)."""
-	PI = DocType("Purchase Invoice")
-	PII = DocType("Purchase Invoice Item")
-	
-	query = (
-		frappe.qb.from_(PI)
-		.join(PII).on(PI.name == PII.parent)
-		.select(
-			PII.name.as_("voucher_detail_no"),
-			PI.posting_date,
-			PI.posting_time,
-			PI.name.as_("voucher_no"),
-			PII.item_code,
-			PII.item_name,
-			PII.warehouse,
-			PII.stock_qty,
-			PII.stock_uom,
-			PII.net_rate.as_("purchase_rate"),  # Use net_rate (excluding GST)
-			PI.owner,
-			PI.company,
-			PI.is_return
-		)
-		.where(
-			(PI.docstatus == 1) &
-			(PI.posting_date[from_date:to_date]) &
-			(PII.item_code.isin(items)) &
-			(PI.company == filters.company)
-		)
-	)
-	
-	# Apply warehouse filter if provided
-	if filters.get("warehouse"):
-		query = query.where(PII.warehouse == filters.warehouse)
+	query = " UNION ALL ".join(branches) + " ORDER BY posting_date, voucher_no"
+	chunk_results = []
+	for chunk in _chunked(items, _IN_CHUNK_SIZE):
+		values["items"] = tuple(chunk)
+		chunk_results.append(frappe.db.sql(query, values, as_dict=True))
+	if len(chunk_results) == 1:
+		return chunk_results[0]
+	# Each chunk comes back ordered; merge them into one ordered list
+	return list(heapq.merge(*chunk_results, key=itemgetter("posting_date", "voucher_no")))
+
+
+def has_stock_ledger_entries(filters, items):
+	"""
+	Check whether any Stock Ledger Entry exists for the report filters.
 	
-	results = query.run(as_dict=True)
-	# Add voucher_type in Python
-	for row in results:
-		row["voucher_type"] = "Purchase Invoice"
-	return results
-
-
-def get_delivery_note_items(filters, items, from_date, to_date):
-	"""Get Delivery Note items - using net_rate (excluding GST)."""
-	DN = DocType("Delivery Note")
-	DNI = DocType("Delivery Note Item")
-	
-	query = (
-		frappe.qb.from_(DN)
-		.join(DNI).on(DN.name == DNI.parent)
-		.select(
-			DNI.name.as_("voucher_detail_no"),
-			DN.posting_date,
-			DN.posting_time,
-			DN.name.as_("voucher_no"),
-			DNI.item_code,
-			DNI.item_name,
-			DNI.warehouse,
-			DNI.stock_qty,
-			DNI.stock_uom,
-			DNI.net_rate.as_("selling_rate"),  # Use net_rate (excluding GST)
-			DN.owner,
-			DN.company,
-			DN.is_return
-		)
-		.where(
-			(DN.docstatus == 1) &
-			(DN.posting_date[from_date:to_date]) &
-			(DNI.item_code.isin(items)) &
-			(DN.company == filters.company)
-		)
-	)
-	
-	# Apply warehouse filter if provided
-	if filters.get("warehouse"):
-		query = query.where(DNI.warehouse == filters.warehouse)
+	The item list is only applied when it fits a single IN chunk; for
+	larger lists the probe checks company, dates and warehouse alone.
 	
-	results = query.run(as_dict=True)
-	# Add voucher_type in Python
-	for row in results:
-		row["voucher_type"] = "Delivery Note"
-	return results
-
-
-def get_purchase_receipt_items(filters, items, from_date, to_date):
-	"""Get Purchase Receipt items - using net_rate (excluding GST)."""
-	PR = DocType("Purchase Receipt")
-	PRI = DocType("Purchase Receipt Item")
-	
-	query = (
-		frappe.qb.from_(PR)
-		.join(PRI).on(PR.name == PRI.parent)
-		.select(
-			PRI.name.as_("voucher_detail_no"),
-			PR.posting_date,
-			PR.posting_time,
-			PR.name.as_("voucher_no"),
-			PRI.item_code,
-			PRI.item_name,
-			PRI.warehouse,
-			PRI.stock_qty,
-			PRI.stock_uom,
-			PRI.net_rate.as_("purchase_rate"),  # Use net_rate (excluding GST)
-			PR.owner,
-			PR.company,
-			PR.is_return
-		)
-		.where(
-			(PR.docstatus == 1) &
-			(PR.posting_date[from_date:to_date]) &
-			(PRI.item_code.isin(items)) &
-			(PR.company == filters.company)
-		)
-	)
-	
-	# Apply warehouse filter if provided
+	Args:
+		filters: Report filters dictionary
+		items: List of item codes
+		
+	Returns:
+		bool: True when at least one SLE matches
+	"""
+	conditions = [
+		"is_cancelled = 0",
+		"company = %(company)s",
+		"posting_date BETWEEN %(from_date)s AND %(to_date)s",
+	]
+	values = {
+		"company": filters.company,
+		"from_date": getdate(filters.from_date),
+		"to_date": getdate(filters.to_date),
+	}
 	if filters.get("warehouse"):
-		query = query.where(PRI.warehouse == filters.warehouse)
-	
-	results = query.run(as_dict=True)
-	# Add voucher_type in Python
-	for row in results:
-		row["voucher_type"] = "Purchase Receipt"
-	return results
+		conditions.append("warehouse = %(warehouse)s")
+		values["warehouse"] = filters.warehouse
+	if len(items) <= _IN_CHUNK_SIZE:
+		conditions.append("item_code IN %(items)s")
+		values["items"] = tuple(items)
+	
+	return bool(frappe.db.sql(
+		f"""
+		SELECT 1 FROM `tabStock Ledger Entry`
+		WHERE {" AND ".join(conditions)}
+		LIMIT 1
+		""",
+		values,
+	))
+
 
+def _chunked(seq, n):
+	"""Yield consecutive slices of seq holding at most n entries."""
+	for i in range(0, len(seq), n):
+		yield seq[i:i + n]
 
-def get_sle_data_bulk(voucher_items, items):
+
+# Latest SLE plus lowest qty_after_transaction per (voucher_detail_no,
+# warehouse); purchase groups that never went negative are dropped
+_LATEST_SLE_QUERY = """
+	SELECT voucher_detail_no, warehouse, valuation_rate,
+		qty_after_transaction, batch_no, min_qty_after_transaction
+	FROM (
+		SELECT voucher_detail_no, warehouse, voucher_type, valuation_rate,
+			qty_after_transaction, batch_no,
+			MIN(qty_after_transaction) OVER (
+				PARTITION BY voucher_detail_no, warehouse
+			) AS min_qty_after_transaction,
+			ROW_NUMBER() OVER (
+				PARTITION BY voucher_detail_no, warehouse
+				ORDER BY posting_date DESC, posting_time DESC, creation DESC
+			) AS row_no
+		FROM `tabStock Ledger Entry`
+		WHERE is_cancelled = 0
+			AND voucher_detail_no IN %(detail_nos)s
+	) sle
+	WHERE row_no = 1
+		AND (min_qty_after_transaction < 0 OR voucher_type IN %(sale_doctypes)s)
+"""
+
+
+def get_sle_data_bulk(voucher_items):
 	"""
-	Bulk fetch Stock Ledger Entry data for all vouchers.
+	Bulk fetch the latest Stock Ledger Entry per voucher item.
+	
+	SLEs are looked up directly by the voucher items' child row names
+	(voucher_detail_no), which is indexed on Stock Ledger Entry. The
+	database reduces each (voucher_detail_no, warehouse) group to its
+	latest entry plus the lowest qty_after_transaction of the group.
+	Purchase groups that never went negative cannot be flagged and are
+	dropped in SQL; their voucher items then have no SLE entry here.
 	
 	Args:
 		voucher_items: List of voucher item dictionaries
-		items: List of item codes
 		
 	Returns:
-		dict: Dictionary keyed by (voucher_type, voucher_no, item_code, warehouse, voucher_detail_no)
-		      containing SLE data
+		dict: Dictionary keyed by (voucher_detail_no, warehouse) with a
+		      (valuation_rate, qty_after_transaction, batch_no,
+		      min_qty_after_transaction) tuple. The warehouse keeps
+		      out the target-warehouse leg a transfer posts against the
+		      same child row.
 	"""
-	if not voucher_items:
-		return {}
-	
-	# Collect unique voucher identifiers
-	voucher_types = set()
-	voucher_nos = set()
-	
-	for item in voucher_items:
-		voucher_types.add(item.get("voucher_type"))
-		voucher_nos.add(item.get("voucher_no"))
-	
-	if not voucher_types or not voucher_nos:
+	detail_nos = list({
+		item.get("voucher_detail_no") for item in voucher_items if item.get("voucher_detail_no")
+	})
+	if not detail_nos:
 		return {}
 	
-	SLE = DocType("Stock Ledger Entry")
-	
-	query = (
-		frappe.qb.from_(SLE)
-		.select(
-			SLE.voucher_type,
-			SLE.voucher_no,
-			SLE.voucher_detail_no,
-			SLE.item_code,
-			SLE.warehouse,
-			SLE.valuation_rate,
-			SLE.qty_after_transaction,
-			SLE.actual_qty,
-			SLE.posting_date,
-			SLE.posting_time,
-			SLE.batch_no,
-		)
-		.where(
-			(SLE.is_cancelled == 0) &
-			(SLE.voucher_type.isin(list(voucher_types))) &
-			(SLE.voucher_no.isin(list(voucher_nos))) &
-			(SLE.item_code.isin(items))
-		)
-	)
-	
-	sle_rows = query.run(as_dict=True)
-	
-	# Index SLE data by key for fast lookup
-	sle_dict = defaultdict(list)
-	for sle in sle_rows:
-		key = (
-			sle.voucher_type,
-			sle.voucher_no,
-			sle.item_code,
-			sle.warehouse,
-			sle.voucher_detail_no or ""
-		)
-		sle_dict[key].append(sle)
+	sle_dict = {}
+	for chunk in _chunked(detail_nos, _IN_CHUNK_SIZE):
+		# Rows are streamed and reduced to their index entry one at a time;
+		# no other query may run until the iterator is exhausted
+		with frappe.db.unbuffered_cursor():
+			sle_rows = frappe.db.sql(
+				_LATEST_SLE_QUERY,
+				{"detail_nos": tuple(chunk), "sale_doctypes": tuple(_SALE_VOUCHER_DOCTYPES)},
+				as_iterator=True,
+			)
+			for voucher_detail_no, warehouse, *values in sle_rows:
+				sle_dict[(voucher_detail_no, warehouse)] = tuple(values)
 	
 	return sle_dict
 
@@ -502,87 +470,80 @@ def build_report_data(voucher_items, sle_data):
 	"""
 	Build report data by matching voucher items with SLE data.
 	
+	Only rows flagged as negative stock or sale below valuation are
+	returned.
+	
 	Args:
 		voucher_items: List of voucher item dictionaries
-		sle_data: Dictionary of SLE data indexed by voucher keys
+		sle_data: Dictionary of SLE data keyed by (voucher_detail_no, warehouse)
 		
 	Returns:
-		list: List of dictionaries containing report rows
+		list: List of report rows, each a list of values in get_columns() order
 	"""
 	report_data = []
 	
+	# Voucher and SLE rows always carry the selected columns, so they are
+	# read by key and each value is bound once per row. The database hands
+	# back numbers or NULL, so float() replaces flt() in this loop
 	for item in voucher_items:
-		voucher_type = item.get("voucher_type")
-		voucher_no = item.get("voucher_no")
-		item_code = item.get("item_code")
-		warehouse = item.get("warehouse")
-		voucher_detail_no = item.get("voucher_detail_no", "")
-		
-		# Find matching SLE rows
-		key = (voucher_type, voucher_no, item_code, warehouse, voucher_detail_no)
-		matching_sles = sle_data.get(key, [])
+		voucher_type = item["voucher_type"]
+		warehouse = item["warehouse"]
 		
-		# Initialize report row
-		row = {
-			"posting_date": item.get("posting_date"),
-			"voucher_type": voucher_type,
-			"voucher_no": voucher_no,
-			"item_code": item_code,
-			"item_name": item.get("item_name"),
-			"stock_qty": flt(item.get("stock_qty")),
-			"stock_uom": item.get("stock_uom"),
-			"warehouse": warehouse,
-			"batch_no": "",
-			"valuation_rate": None,
-			"qty_after_transaction": None,
-			"selling_rate": None,
-			"gross_margin_proxy": None,
-			"is_negative_stock": 0,
-			"is_sale_below_valuation": 0,
-			"owner": item.get("owner")
-		}
+		# Latest SLE of this voucher item
+		latest_sle = sle_data.get((item["voucher_detail_no"], warehouse))
 		
-		# Process matching SLE rows
-		if matching_sles:
-			# Get valuation rate and qty_after_transaction from SLE
-			# Use the last SLE entry (most recent) for this voucher item
-			latest_sle = matching_sles[-1]
-			
-			valuation_rate = flt(latest_sle.get("valuation_rate"))
-			qty_after_transaction = flt(latest_sle.get("qty_after_transaction"))
-			
-			row["valuation_rate"] = valuation_rate if valuation_rate > 0 else None
-			row["qty_after_transaction"] = qty_after_transaction
-			row["batch_no"] = latest_sle.get("batch_no") or ""
-
-			# Check for negative stock across all matching SLEs
-			for sle in matching_sles:
-				if flt(sle.get("qty_after_transaction")) < 0:
-					row["is_negative_stock"] = 1
-					break
-		else:
-			# No SLE found - might be a non-stock item or missing entry
-			row["valuation_rate"] = None
-			row["qty_after_transaction"] = None
+		batch_no = ""
+		valuation_rate = None
+		qty_after_transaction = None
+		is_negative_stock = 0
+		if latest_sle:
+			valuation_rate, qty_after_transaction, batch_no, min_qty_after_transaction = latest_sle
+			valuation_rate = float(valuation_rate or 0)
+			if valuation_rate <= 0:
+				valuation_rate = None
+			qty_after_transaction = float(qty_after_transaction or 0)
+			batch_no = batch_no or ""
+
+			# Negative stock if any SLE of the item went below zero
+			if float(min_qty_after_transaction or 0) < 0:
+				is_negative_stock = 1
 		
 		# For Sales Invoice and Delivery Note: Check sale below valuation
-		# Use net_rate (already fetched as selling_rate for SI/DN)
-		if voucher_type in ["Sales Invoice", "Delivery Note"] and not item.get("is_return"):
-			selling_rate = flt(item.get("selling_rate"))  # This is net_rate from child table
-			valuation_rate = row.get("valuation_rate")
+		# Use net_rate (excluding GST) from the SI/DN child row
+		selling_rate = None
+		gross_margin_proxy = None
+		is_sale_below_valuation = 0
+		if voucher_type in _SALE_VOUCHER_DOCTYPES and not item["is_return"]:
+			selling_rate = float(item["net_rate"] or 0) or None  # Child row rate excluding GST
 			
-			if selling_rate and valuation_rate and valuation_rate > 0:
-				row["selling_rate"] = selling_rate
+			if selling_rate and valuation_rate:
 				# Gross margin = selling_rate - valuation_rate (can be negative)
-				row["gross_margin_proxy"] = selling_rate - valuation_rate
+				gross_margin_proxy = selling_rate - valuation_rate
 				
 				# Flag if selling rate is below valuation rate (loss situation)
 				if selling_rate < valuation_rate:
-					row["is_sale_below_valuation"] = 1
-			elif selling_rate:
-				row["selling_rate"] = selling_rate
-				row["gross_margin_proxy"] = None
+					is_sale_below_valuation = 1
+		
+		if not (is_negative_stock or is_sale_below_valuation):
+			continue
 		
-		report_data.append(row)
+		report_data.append([
+			item["posting_date"],
+			voucher_type,
+			item["voucher_no"],
+			item["item_code"],
+			item["item_name"],
+			float(item["stock_qty"] or 0),
+			item["stock_uom"],
+			warehouse,
+			batch_no,
+			valuation_rate,
+			qty_after_transaction,
+			selling_rate,
+			gross_margin_proxy,
+			is_negative_stock,
+			is_sale_below_valuation,
+			item["owner"],
+		])
 	
 	return report_data
@@ -1,14 +1,12 @@
 # Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
 # License: GNU General Public License v3. See license.txt
 
-
-import copy
-from collections import OrderedDict
+from operator import itemgetter
 
 import frappe
 from frappe import _, _dict
 from frappe.query_builder import Criterion
-from frappe.utils import cstr, flt, fmt_money, getdate
+from frappe.utils import cint, cstr, flt, fmt_money, get_number_format_info, getdate
 
 from erpnext import get_company_currency, get_default_company
 from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
@@ -17,7 +15,6 @@ from erpnext.accounts.doctype.accounting_dimension.accounting_dimension import (
 )
 from erpnext.accounts.report.financial_statements import get_cost_centers_with_children
 from erpnext.accounts.report.utils import convert_to_presentation_currency, get_currency
-from erpnext.accounts.utils import get_account_currency
 
 
 def execute(filters=None):
@@ -28,7 +25,9 @@ def execute(filters=None):
 	if filters and filters.get("print_in_account_currency") and not filters.get("account"):
 		frappe.throw(_("Select an account to print in account currency"))
 
-	for acc in frappe.db.sql("""select name, is_group from tabAccount""", as_dict=1):
+	for acc in frappe.get_all(
+		"Account", filters={"company": filters.get("company")}, fields=["name", "is_group"]
+	):
 		account_details.setdefault(acc.name, acc)
 
 	if filters.get("party"):
@@ -47,6 +46,19 @@ def execute(filters=None):
 
 	columns = get_columns(filters)
 
+	# Expand to descendants only now: validation and currency detection work on
+	# the accounts as selected. Selections that resolve to nothing would
+	# otherwise drop their condition and scan the whole ledger.
+	if filters.get("account"):
+		filters.account = get_accounts_with_children(filters.account)
+		if not filters.account:
+			return columns, []
+
+	if filters.get("cost_center"):
+		filters.cost_center = get_cost_centers_with_children(filters.cost_center)
+		if not filters.cost_center:
+			return columns, []
+
 	res = get_result(filters, account_details)
 
 	return columns, res
@@ -101,18 +113,9 @@ def set_account_currency(filters):
 		account_currency = None
 
 		if filters.get("account"):
-			if len(filters.get("account")) == 1:
-				account_currency = get_account_currency(filters.account[0])
-			else:
-				currency = get_account_currency(filters.account[0])
-				is_same_account_currency = True
-				for account in filters.get("account"):
-					if get_account_currency(account) != currency:
-						is_same_account_currency = False
-						break
-
-				if is_same_account_currency:
-					account_currency = currency
+			currencies = set(get_account_currencies(filters.account).values())
+			if len(currencies) == 1:
+				account_currency = currencies.pop()
 
 		elif filters.get("party"):
 			gle_filters = {"party": filters.party[0], "company": filters.company}
@@ -148,6 +151,22 @@ def set_account_currency(filters):
 	return filters
 
 
+def get_account_currencies(accounts):
+	"""
+	Fetch currencies for the given accounts in one query.
+	Accounts without a currency fall back to the company currency, like get_account_currency.
+	Returns dict: {account: currency}
+	"""
+	return {
+		d.name: d.account_currency or get_company_currency(d.company)
+		for d in frappe.get_all(
+			"Account",
+			filters={"name": ["in", accounts]},
+			fields=["name", "account_currency", "company"],
+		)
+	}
+
+
 def get_result(filters, account_details):
 	accounting_dimensions = []
 	if filters.get("include_dimensions"):
@@ -546,21 +565,29 @@ def get_gl_entries(filters, accounting_dimensions):
 			"debit_in_transaction_currency, credit_in_transaction_currency, transaction_currency,"
 		)
 
-	gl_entries = frappe.db.sql(
-		f"""
-		select
-			name as gl_entry, posting_date, account, party_type, party,
-			voucher_type, voucher_subtype, voucher_no, {dimension_fields}
-			cost_center, project, {transaction_currency_fields}
-			against_voucher_type, against_voucher, account_currency,
-			against, is_opening, creation {select_fields}
-		from `tabGL Entry`
-		where company=%(company)s {get_conditions(filters)}
-		{order_by_statement}
-	""",
-		filters,
-		as_dict=1,
-	)
+	# Built first: it runs its own lookups, which cannot share the
+	# unbuffered connection below
+	conditions = get_conditions(filters)
+
+	# Rows are streamed from the server into the list instead of being
+	# buffered in full by the driver and then copied into dicts
+	with frappe.db.unbuffered_cursor():
+		gl_entries = list(frappe.db.sql(
+			f"""
+			select
+				name as gl_entry, posting_date, account, party_type, party,
+				voucher_type, voucher_subtype, voucher_no, {dimension_fields}
+				cost_center, project, {transaction_currency_fields}
+				against_voucher_type, against_voucher, account_currency,
+				against, is_opening, creation {select_fields}
+			from `tabGL Entry`
+			where company=%(company)s {conditions}
+			{order_by_statement}
+		""",
+			filters,
+			as_dict=1,
+			as_iterator=True,
+		))
 
 	if filters.get("presentation_currency"):
 		return convert_to_presentation_currency(gl_entries, currency_map)
@@ -572,12 +599,9 @@ def get_conditions(filters):
 	conditions = []
 
 	if filters.get("account"):
-		filters.account = get_accounts_with_children(filters.account)
-		if filters.account:
-			conditions.append("account in %(account)s")
+		conditions.append("account in %(account)s")
 
 	if filters.get("cost_center"):
-		filters.cost_center = get_cost_centers_with_children(filters.cost_center)
 		conditions.append("cost_center in %(cost_center)s")
 
 	if filters.get("voucher_no"):
@@ -616,6 +640,17 @@ def get_conditions(filters):
 			]
 			filters.update({"voucher_no_not_in": vouchers_to_ignore})
 
+	# Exclude system-generated Journal Entries (used for inter-party settlements etc.)
+	system_generated_journals = frappe.db.get_all(
+		"Journal Entry",
+		filters={"company": filters.get("company"), "is_system_generated": 1},
+		pluck="name",
+	)
+	if system_generated_journals:
+		filters.update(
+			{"voucher_no_not_in": (filters.get("voucher_no_not_in") or []) + system_generated_journals}
+		)
+
 	if filters.get("voucher_no_not_in"):
 		conditions.append("voucher_no not in %(voucher_no_not_in)s")
 
@@ -660,9 +695,6 @@ def get_conditions(filters):
 
 	if not filters.get("show_cancelled_entries"):
 		conditions.append("is_cancelled = 0")
-	
-	# Exclude system-generated Journal Entries (used for inter-party settlements etc.)
-	conditions.append("voucher_no NOT IN (SELECT name FROM `tabJournal Entry` WHERE is_system_generated = 1)")
 
 	from frappe.desk.reportview import build_match_conditions
 
@@ -711,21 +743,15 @@ def get_accounts_with_children(accounts):
 	return frappe.qb.from_(doctype).select(doctype.name).where(Criterion.any(conditions)).run(pluck=True)
 
 
-def set_bill_no(gl_entries):
-	inv_details = get_supplier_invoice_details()
-	for gl in gl_entries:
-		gl["bill_no"] = inv_details.get(gl.get("against_voucher"), "")
-
-
 def get_data_with_opening_closing(filters, account_details, accounting_dimensions, gl_entries):
 	data = []
-	totals_dict = get_totals_dict()
-
-	set_bill_no(gl_entries)
+	totals_labels = get_totals_labels()
 
-	gle_map = initialize_gle_map(gl_entries, filters, totals_dict)
+	gle_map = initialize_gle_map(gl_entries, filters, totals_labels)
 
-	totals, entries = get_accountwise_gle(filters, accounting_dimensions, gl_entries, gle_map, totals_dict)
+	totals, entries = get_accountwise_gle(
+		filters, accounting_dimensions, gl_entries, gle_map, get_totals_dict(totals_labels)
+	)
 
 	# Opening for filtered account
 	data.append(totals.opening)
@@ -761,7 +787,13 @@ def get_data_with_opening_closing(filters, account_details, accounting_dimension
 	return data
 
 
-def get_totals_dict():
+def get_totals_labels():
+	return _("Opening"), _("Total"), _("Closing")
+
+
+def get_totals_dict(totals_labels=None):
+	opening_label, total_label, closing_label = totals_labels or get_totals_labels()
+
 	def _get_debit_credit_dict(label):
 		return _dict(
 			account=f"'{label}'",
@@ -774,9 +806,9 @@ def get_totals_dict():
 		)
 
 	return _dict(
-		opening=_get_debit_credit_dict(_("Opening")),
-		total=_get_debit_credit_dict(_("Total")),
-		closing=_get_debit_credit_dict(_("Closing")),
+		opening=_get_debit_credit_dict(opening_label),
+		total=_get_debit_credit_dict(total_label),
+		closing=_get_debit_credit_dict(closing_label),
 	)
 
 
@@ -789,45 +821,67 @@ def group_by_field(group_by):
 		return "voucher_no"
 
 
-def initialize_gle_map(gl_entries, filters, totals_dict):
-	gle_map = OrderedDict()
+def initialize_gle_map(gl_entries, filters, totals_labels=None):
+	gle_map = {}
+
+	# Consolidated output is built from consolidated_gle and never reads the map
+	if filters.get("group_by") == "Group by Voucher (Consolidated)":
+		return gle_map
+
 	group_by = group_by_field(filters.get("group_by"))
 
 	for gle in gl_entries:
-		gle_map.setdefault(gle.get(group_by), _dict(totals=copy.deepcopy(totals_dict), entries=[]))
+		group_by_value = gle.get(group_by)
+		if group_by_value not in gle_map:
+			gle_map[group_by_value] = _dict(totals=get_totals_dict(totals_labels), entries=[])
 	return gle_map
 
 
 def get_accountwise_gle(filters, accounting_dimensions, gl_entries, gle_map, totals):
 	entries = []
-	consolidated_gle = OrderedDict()
+	consolidated_gle = {}
 	group_by = group_by_field(filters.get("group_by"))
 	group_by_voucher_consolidated = filters.get("group_by") == "Group by Voucher (Consolidated)"
 
-	if filters.get("show_net_values_in_party_account"):
+	# Read once; update_value_in_dict runs several times for every GL row
+	add_values_in_transaction_currency = filters.get("add_values_in_transaction_currency")
+	show_net_values_in_party_account = filters.get("show_net_values_in_party_account")
+
+	if show_net_values_in_party_account:
 		account_type_map = get_account_type_map(filters.get("company"))
 
 	immutable_ledger = frappe.db.get_single_value("Accounts Settings", "enable_immutable_ledger")
 
+	# Fields identifying a consolidated row; every one of them is selected
+	# by get_gl_entries
+	key_fields = ["posting_date", "voucher_type", "voucher_no", "account", "party_type", "party"]
+	if immutable_ledger:
+		key_fields.append("creation")
+	if filters.get("include_dimensions"):
+		key_fields += accounting_dimensions
+		key_fields.append("cost_center")
+	get_consolidation_key = itemgetter(*key_fields)
+
 	def update_value_in_dict(data, key, gle):
-		data[key].debit += gle.debit
-		data[key].credit += gle.credit
+		# Plain item access: _dict attribute access goes through a Python-level
+		# dict.get call, and this runs several times for every GL row
+		row = data[key]
+		row["debit"] += gle["debit"]
+		row["credit"] += gle["credit"]
 
-		data[key].debit_in_account_currency += gle.debit_in_account_currency
-		data[key].credit_in_account_currency += gle.credit_in_account_currency
+		row["debit_in_account_currency"] += gle["debit_in_account_currency"]
+		row["credit_in_account_currency"] += gle["credit_in_account_currency"]
 
-		if filters.get("add_values_in_transaction_currency") and key not in ["opening", "closing", "total"]:
-			data[key].debit_in_transaction_currency += gle.debit_in_transaction_currency
-			data[key].credit_in_transaction_currency += gle.credit_in_transaction_currency
+		if add_values_in_transaction_currency and key not in ("opening", "closing", "total"):
+			row["debit_in_transaction_currency"] += gle["debit_in_transaction_currency"]
+			row["credit_in_transaction_currency"] += gle["credit_in_transaction_currency"]
 
-		if filters.get("show_net_values_in_party_account") and account_type_map.get(data[key].account) in (
+		if show_net_values_in_party_account and account_type_map.get(row.get("account")) in (
 			"Receivable",
 			"Payable",
 		):
-			net_value = data[key].debit - data[key].credit
-			net_value_in_account_currency = (
-				data[key].debit_in_account_currency - data[key].credit_in_account_currency
-			)
+			net_value = row["debit"] - row["credit"]
+			net_value_in_account_currency = row["debit_in_account_currency"] - row["credit_in_account_currency"]
 
 			if net_value < 0:
 				dr_or_cr = "credit"
@@ -836,60 +890,50 @@ def get_accountwise_gle(filters, accounting_dimensions, gl_entries, gle_map, tot
 				dr_or_cr = "debit"
 				rev_dr_or_cr = "credit"
 
-			data[key][dr_or_cr] = abs(net_value)
-			data[key][dr_or_cr + "_in_account_currency"] = abs(net_value_in_account_currency)
-			data[key][rev_dr_or_cr] = 0
-			data[key][rev_dr_or_cr + "_in_account_currency"] = 0
+			row[dr_or_cr] = abs(net_value)
+			row[dr_or_cr + "_in_account_currency"] = abs(net_value_in_account_currency)
+			row[rev_dr_or_cr] = 0
+			row[rev_dr_or_cr + "_in_account_currency"] = 0
+
+		if row.get("against_voucher") and gle.get("against_voucher"):
+			row["against_voucher"] += ", " + gle["against_voucher"]
 
-		if data[key].against_voucher and gle.against_voucher:
-			data[key].against_voucher += ", " + gle.against_voucher
+	# voucher_subtype, against_voucher_type and party_type take a handful of
+	# distinct values, so each is translated once per report
+	translations = {}
+
+	def translate(value):
+		if value not in translations:
+			translations[value] = _(value)
+		return translations[value]
 
 	from_date, to_date = getdate(filters.from_date), getdate(filters.to_date)
 	show_opening_entries = filters.get("show_opening_entries")
 
 	for gle in gl_entries:
 		group_by_value = gle.get(group_by)
-		gle.voucher_subtype = _(gle.voucher_subtype)
-		gle.against_voucher_type = _(gle.against_voucher_type)
+		gle.voucher_subtype = translate(gle.voucher_subtype)
+		gle.against_voucher_type = translate(gle.against_voucher_type)
 		gle.remarks = _(gle.remarks)
-		gle.party_type = _(gle.party_type)
+		gle.party_type = translate(gle.party_type)
+
+		is_opening = gle.is_opening == "Yes"
 
-		if gle.posting_date < from_date or (cstr(gle.is_opening) == "Yes" and not show_opening_entries):
+		if gle.posting_date < from_date or (is_opening and not show_opening_entries):
 			if not group_by_voucher_consolidated:
 				update_value_in_dict(gle_map[group_by_value].totals, "opening", gle)
-				update_value_in_dict(gle_map[group_by_value].totals, "closing", gle)
 
 			update_value_in_dict(totals, "opening", gle)
-			update_value_in_dict(totals, "closing", gle)
 
-		elif gle.posting_date <= to_date or (cstr(gle.is_opening) == "Yes" and show_opening_entries):
+		elif gle.posting_date <= to_date or (is_opening and show_opening_entries):
 			if not group_by_voucher_consolidated:
 				update_value_in_dict(gle_map[group_by_value].totals, "total", gle)
-				update_value_in_dict(gle_map[group_by_value].totals, "closing", gle)
 				update_value_in_dict(totals, "total", gle)
-				update_value_in_dict(totals, "closing", gle)
 
 				gle_map[group_by_value].entries.append(gle)
 
 			elif group_by_voucher_consolidated:
-				keylist = [
-					gle.get("posting_date"),
-					gle.get("voucher_type"),
-					gle.get("voucher_no"),
-					gle.get("account"),
-					gle.get("party_type"),
-					gle.get("party"),
-				]
-
-				if immutable_ledger:
-					keylist.append(gle.get("creation"))
-
-				if filters.get("include_dimensions"):
-					for dim in accounting_dimensions:
-						keylist.append(gle.get(dim))
-					keylist.append(gle.get("cost_center"))
-
-				key = tuple(keylist)
+				key = get_consolidation_key(gle)
 				if key not in consolidated_gle:
 					consolidated_gle.setdefault(key, gle)
 				else:
@@ -897,12 +941,24 @@ def get_accountwise_gle(filters, accounting_dimensions, gl_entries, gle_map, tot
 
 	for value in consolidated_gle.values():
 		update_value_in_dict(totals, "total", value)
-		update_value_in_dict(totals, "closing", value)
 		entries.append(value)
 
+	# Closing is opening + total, so it is summed once per group rather
+	# than accumulated alongside them on every row
+	if not group_by_voucher_consolidated:
+		for acc_dict in gle_map.values():
+			set_closing_totals(acc_dict.totals)
+
+	set_closing_totals(totals)
+
 	return totals, entries
 
 
+def set_closing_totals(totals):
+	for field in ("debit", "credit", "debit_in_account_currency", "credit_in_account_currency"):
+		totals.closing[field] = totals.opening[field] + totals.total[field]
+
+
 def get_account_type_map(company):
 	account_type_map = frappe._dict(
 		frappe.get_all("Account", fields=["name", "account_type"], filters={"company": company}, as_list=1)
@@ -913,17 +969,10 @@ def get_account_type_map(company):
 
 def get_result_as_list(data, filters):
 	balance = 0
-	supplier_invoice_details = get_supplier_invoice_details()
 
 	voucher_nos_by_type = collect_voucher_nos_by_type(data)
 
-	payment_references = get_payment_entry_references(voucher_nos_by_type.get("Payment Entry", []))
-	journal_references = get_journal_entry_references(voucher_nos_by_type.get("Journal Entry", []))
-
-	invoice_return_status = get_invoice_return_status(
-		voucher_nos_by_type.get("Sales Invoice", []),
-		voucher_nos_by_type.get("Purchase Invoice", [])
-	)
+	voucher_references = get_voucher_references(voucher_nos_by_type)
 
 	use_account_currency = (
 		filters.get("show_in_account_currency")
@@ -933,6 +982,13 @@ def get_result_as_list(data, filters):
 
 	display_currency = filters.get("account_currency") if use_account_currency else filters.get("company_currency")
 
+	# Resolve what fmt_money would otherwise look up from system defaults on
+	# every row
+	number_format = frappe.db.get_default("number_format") or "#,###.##"
+	precision = (
+		cint(frappe.db.get_default("currency_precision")) or get_number_format_info(number_format)[2]
+	)
+
 	for d in data:
 		if use_account_currency:
 			d["debit"] = d.get("debit_in_account_currency", 0)
@@ -943,39 +999,34 @@ def get_result_as_list(data, filters):
 
 		balance = get_balance(d, balance, "debit", "credit")
 
-		if d.get("voucher_no") or d.get("remarks"):
-			d["reference_with_remarks"] = f"{d.get('voucher_no', '')} {d.get('remarks', '')}".strip()
-
-		if balance >= 0:
-			d["balance"] = f"{fmt_money(balance, currency=display_currency)} Dr"
-		else:
-			d["balance"] = f"{fmt_money(abs(balance), currency=display_currency)} Cr"
+		voucher_no = d.get("voucher_no")
+		remarks = d.get("remarks")
+		if voucher_no or remarks:
+			d["reference_with_remarks"] = f"{voucher_no or ''} {remarks or ''}".strip()
 
-		bill_info = supplier_invoice_details.get(d.get("voucher_no"), {})
-		if isinstance(bill_info, dict):
-			d["bill_no"] = bill_info.get("bill_no", "")
-			d["bill_date"] = bill_info.get("bill_date", "")
-		else:
-			d["bill_no"] = bill_info or ""
-			d["bill_date"] = ""
+		balance_amount = fmt_money(
+			abs(balance), precision=precision, currency=display_currency, format=number_format
+		)
+		d["balance"] = f"{balance_amount} {'Dr' if balance >= 0 else 'Cr'}"
 
-		voucher_no = d.get("voucher_no")
 		voucher_type = d.get("voucher_type")
-
-		if voucher_type == "Payment Entry" and voucher_no in payment_references:
-			d["ref_no"] = payment_references[voucher_no]
-		elif voucher_type == "Journal Entry" and voucher_no in journal_references:
-			d["ref_no"] = journal_references[voucher_no]
+		reference = voucher_references.get((voucher_type, voucher_no))
+
+		if reference:
+			d["bill_no"] = reference.bill_no or ""
+			d["bill_date"] = reference.bill_date if reference.bill_no else ""
+			d["ref_no"] = reference.ref_no or ""
+
+			if reference.is_return:
+				if voucher_type == "Sales Invoice":
+					d["voucher_subtype"] = _("Credit Note")
+				elif voucher_type == "Purchase Invoice":
+					d["voucher_subtype"] = _("Debit Note")
 		else:
+			d["bill_no"] = ""
+			d["bill_date"] = ""
 			d["ref_no"] = ""
 
-		if voucher_type == "Sales Invoice" and voucher_no in invoice_return_status:
-			if invoice_return_status[voucher_no].get("is_return"):
-				d["voucher_subtype"] = _("Credit Note")
-		elif voucher_type == "Purchase Invoice" and voucher_no in invoice_return_status:
-			if invoice_return_status[voucher_no].get("is_return"):
-				d["voucher_subtype"] = _("Debit Note")
-
 		d["account_currency"] = display_currency
 
 	return data
@@ -999,116 +1050,54 @@ def collect_voucher_nos_by_type(data):
 	return {k: list(v) for k, v in voucher_nos_by_type.items()}
 
 
-def get_supplier_invoice_details():
-	"""Fetch bill_no and bill_date from Purchase Invoice."""
-	inv_details = {}
-	for d in frappe.db.sql(
-		""" select name, bill_no, bill_date from `tabPurchase Invoice`
-		where docstatus = 1 and bill_no is not null and bill_no != '' """,
-		as_dict=1,
-	):
-		inv_details[d.name] = {
-			"bill_no": d.bill_no,
-			"bill_date": d.bill_date
-		}
-
-	return inv_details
+# (voucher_type, table, ref_no column, bill columns, is_return column) per
+# branch of the references query
+VOUCHER_REFERENCE_SOURCES = (
+	("Payment Entry", "tabPayment Entry", "reference_no", False, False),
+	("Journal Entry", "tabJournal Entry", "cheque_no", False, False),
+	("Sales Invoice", "tabSales Invoice", None, False, True),
+	("Purchase Invoice", "tabPurchase Invoice", None, True, True),
+)
 
 
-def get_payment_entry_references(voucher_nos=None):
+def get_voucher_references(voucher_nos_by_type):
 	"""
-	Fetch reference_no (Cheque/Reference No) for Payment Entries.
-	
-	Args:
-		voucher_nos: List of Payment Entry names to filter. If None, fetches all.
-	
-	Returns:
-		dict: {payment_entry_name: reference_no}
-	"""
-	ref_details = {}
-	
-	if voucher_nos is not None and not voucher_nos:
-		return ref_details  # No Payment Entries to look up
-	
-	conditions = "docstatus = 1 and reference_no is not null and reference_no != ''"
-	if voucher_nos:
-		conditions += " and name in %(voucher_nos)s"
-	
-	for d in frappe.db.sql(
-		f""" select name, reference_no from `tabPayment Entry`
-		where {conditions} """,
-		{"voucher_nos": voucher_nos} if voucher_nos else {},
-		as_dict=1,
-	):
-		ref_details[d.name] = d.reference_no
-
-	return ref_details
+	Fetch reference numbers, supplier bill details and return status for the
+	vouchers in the report, in one UNION ALL query.
 
-
-def get_journal_entry_references(voucher_nos=None):
-	"""
-	Fetch cheque_no (Reference Number) for Journal Entries.
-	
 	Args:
-		voucher_nos: List of Journal Entry names to filter. If None, fetches all.
-	
+		voucher_nos_by_type: {voucher_type: [list of voucher_nos]}
+
 	Returns:
-		dict: {journal_entry_name: cheque_no}
+		dict: {(voucher_type, voucher_no): {"ref_no", "bill_no", "bill_date", "is_return"}}
 	"""
-	ref_details = {}
-	
-	if voucher_nos is not None and not voucher_nos:
-		return ref_details  # No Journal Entries to look up
-	
-	conditions = "docstatus = 1 and cheque_no is not null and cheque_no != ''"
-	if voucher_nos:
-		conditions += " and name in %(voucher_nos)s"
-	
-	for d in frappe.db.sql(
-		f""" select name, cheque_no from `tabJournal Entry`
-		where {conditions} """,
-		{"voucher_nos": voucher_nos} if voucher_nos else {},
-		as_dict=1,
-	):
-		ref_details[d.name] = d.cheque_no
+	branches = []
+	params = {}
 
-	return ref_details
+	for voucher_type, table, ref_no_field, has_bill, has_return in VOUCHER_REFERENCE_SOURCES:
+		voucher_nos = voucher_nos_by_type.get(voucher_type)
+		if not voucher_nos:
+			continue
 
+		param = frappe.scrub(voucher_type)
+		params[param] = voucher_nos
+		branches.append(
+			f""" select '{voucher_type}' as voucher_type, name,
+				{ref_no_field or "null"} as ref_no,
+				{"bill_no" if has_bill else "null"} as bill_no,
+				{"bill_date" if has_bill else "null"} as bill_date,
+				{"is_return" if has_return else "0"} as is_return
+			from `{table}`
+			where docstatus = 1 and name in %({param})s """
+		)
 
-def get_invoice_return_status(sales_invoice_nos=None, purchase_invoice_nos=None):
-	"""
-	Fetch is_return status for Sales Invoices and Purchase Invoices.
-	
-	Args:
-		sales_invoice_nos: List of Sales Invoice names to check
-		purchase_invoice_nos: List of Purchase Invoice names to check
-	
-	Returns:
-		dict: {invoice_name: {"is_return": bool, "doctype": str}}
-	"""
-	return_status = {}
-	
-	# Fetch Sales Invoice return status
-	if sales_invoice_nos:
-		for d in frappe.db.sql(
-			""" select name, is_return from `tabSales Invoice`
-			where docstatus = 1 and name in %(voucher_nos)s """,
-			{"voucher_nos": sales_invoice_nos},
-			as_dict=1,
-		):
-			return_status[d.name] = {"is_return": d.is_return, "doctype": "Sales Invoice"}
-	
-	# Fetch Purchase Invoice return status
-	if purchase_invoice_nos:
-		for d in frappe.db.sql(
-			""" select name, is_return from `tabPurchase Invoice`
-			where docstatus = 1 and name in %(voucher_nos)s """,
-			{"voucher_nos": purchase_invoice_nos},
-			as_dict=1,
-		):
-			return_status[d.name] = {"is_return": d.is_return, "doctype": "Purchase Invoice"}
-	
-	return return_status
+	if not branches:
+		return {}
+
+	return {
+		(d.voucher_type, d.name): d
+		for d in frappe.db.sql(" union all ".join(branches), params, as_dict=1)
+	}
 
 
 def get_balance(row, balance, debit_field, credit_field):
@@ -1206,20 +1195,21 @@ def get_columns(filters):
 def get_complete_party_list(parties):
     """Retrieve the complete list of parties including primary and secondary parties."""
     complete_party_list = set(parties)
-    for party in parties:
-        linked_parties = frappe.db.sql(
-            """
-            SELECT secondary_party FROM `tabParty Link`
-            WHERE primary_party = %s
-            UNION
-            SELECT primary_party FROM `tabParty Link`
-            WHERE secondary_party = %s
-            """,
-            (party, party),
-            as_list=True
-        )
-        for linked_party in linked_parties:
-            complete_party_list.add(linked_party[0])
+    if not parties:
+        return list(complete_party_list)
+
+    # One query for all parties; both ends of each matching link are kept
+    links = frappe.db.sql(
+        """
+        SELECT primary_party, secondary_party FROM `tabParty Link`
+        WHERE primary_party IN %(parties)s OR secondary_party IN %(parties)s
+        """,
+        {"parties": tuple(parties)},
+        as_list=True
+    )
+    for primary_party, secondary_party in links:
+        complete_party_list.add(primary_party)
+        complete_party_list.add(secondary_party)
     return list(complete_party_list)
 
 
@@ -1289,8 +1279,6 @@ def get_statement_meta(filters):
     
     # 2. Party Info
     if party:
-        from frappe.contacts.doctype.address.address import get_default_address
-        
         # Determine party type
         is_customer = frappe.db.exists("Customer", party)
         party_type = "Customer" if is_customer else "Supplier"
@@ -1315,41 +1303,19 @@ def get_statement_meta(filters):
         address_field = "customer_primary_address" if is_customer else "supplier_primary_address"
         address_name = party_doc.get(address_field)
         
-        # Fallback to default address
-        if not address_name:
-            address_name = get_default_address(party_type, party)
-        
-        # Fallback to Dynamic Link
+        # Fallback to any linked address
         if not address_name:
-            address_links = frappe.get_all(
-                "Dynamic Link",
-                filters={
-                    "link_doctype": party_type,
-                    "link_name": party,
-                    "parenttype": "Address"
-                },
-                fields=["parent"],
-                limit=1
-            )
-            if address_links:
-                address_name = address_links[0].parent
+            address_name = get_linked_address(party_type, party)
         
         # Build simplified address: City, State, Country, Pincode
-        if address_name:
-            try:
-                addr_doc = frappe.get_doc("Address", address_name)
-                addr_parts = []
-                if addr_doc.city:
-                    addr_parts.append(addr_doc.city)
-                if addr_doc.state:
-                    addr_parts.append(addr_doc.state)
-                if addr_doc.country:
-                    addr_parts.append(addr_doc.country)
-                if addr_doc.pincode:
-                    addr_parts.append(str(addr_doc.pincode))
-                meta.party.address = ", ".join(addr_parts)
-            except Exception:
-                meta.party.address = ""
+        # (only these fields are needed, so skip loading the full document)
+        address = address_name and frappe.db.get_value(
+            "Address", address_name, ["city", "state", "country", "pincode"], as_dict=True
+        )
+        if address:
+            meta.party.address = ", ".join(
+                str(value) for value in (address.city, address.state, address.country, address.pincode) if value
+            )
         else:
             meta.party.address = ""
         
@@ -1362,83 +1328,65 @@ def get_statement_meta(filters):
     return meta
 
 
+def get_linked_address(party_type, party):
+    """
+    Pick one Address linked to the party in a single query: enabled before
+    disabled, then primary first, as get_default_address would.
+    """
+    address = frappe.db.sql(
+        """
+        SELECT addr.name
+        FROM `tabAddress` addr
+        INNER JOIN `tabDynamic Link` dl
+            ON dl.parent = addr.name AND dl.parenttype = 'Address'
+        WHERE dl.link_doctype = %s AND dl.link_name = %s
+        ORDER BY IFNULL(addr.disabled, 0), addr.is_primary_address DESC
+        LIMIT 1
+        """,
+        (party_type, party),
+    )
+    return address[0][0] if address else None
+
+
 def get_party_ageing(company, party, party_type, report_date, currency):
     """
     Calculate ageing from Payment Ledger Entry.
     Buckets: 0-30, 30-60, 60-90, 90-120, 120+
     """
-    from frappe.utils import date_diff, getdate, flt
-    
-    ageing = frappe._dict({
-        "range1": 0,  # 0-30
-        "range2": 0,  # 30-60
-        "range3": 0,  # 60-90
-        "range4": 0,  # 90-120
-        "range5": 0,  # 120+
-    })
+    from frappe.utils import getdate
     
     report_date = getdate(report_date)
     
     try:
-        # Get outstanding entries from Payment Ledger Entry
-        ple = frappe.qb.DocType("Payment Ledger Entry")
-        
-        query = (
-            frappe.qb.from_(ple)
-            .select(
-                ple.posting_date,
-                ple.amount,
-                ple.amount_in_account_currency
-            )
-            .where(ple.company == company)
-            .where(ple.party_type == party_type)
-            .where(ple.party == party)
-            .where(ple.posting_date <= report_date)
-            .where(ple.delinked == 0)
+        # Net outstanding per invoice: payments and returns point at the
+        # invoice they settle through against_voucher_*. Payables are negative
+        # in PLE, so supplier amounts are flipped to make outstanding positive.
+        return get_ageing_buckets(
+            """
+            SELECT
+                DATEDIFF(%(report_date)s, MIN(posting_date)) AS age,
+                SUM(amount) * %(sign)s AS outstanding
+            FROM `tabPayment Ledger Entry`
+            WHERE company = %(company)s
+            AND party_type = %(party_type)s
+            AND party = %(party)s
+            AND posting_date <= %(report_date)s
+            AND delinked = 0
+            GROUP BY against_voucher_type, against_voucher_no
+            HAVING outstanding > 0
+            """,
+            {
+                "company": company,
+                "party_type": party_type,
+                "party": party,
+                "report_date": report_date,
+                "sign": -1 if party_type == "Supplier" else 1,
+            },
         )
-        
-        entries = query.run(as_dict=True)
-        
-        # Calculate outstanding per voucher and assign to buckets
-        voucher_outstanding = {}
-        for entry in entries:
-            key = (entry.get("voucher_type"), entry.get("voucher_no"), entry.posting_date)
-            if key not in voucher_outstanding:
-                voucher_outstanding[key] = {"posting_date": entry.posting_date, "amount": 0}
-            voucher_outstanding[key]["amount"] += flt(entry.amount)
-        
-        # Assign to ageing buckets based on posting date
-        for key, data in voucher_outstanding.items():
-            outstanding = data["amount"]
-            if outstanding == 0:
-                continue
-            
-            # For receivables, positive means outstanding; for payables, negative means outstanding
-            if party_type == "Supplier":
-                outstanding = -outstanding  # Payables are negative in PLE
-            
-            if outstanding <= 0:
-                continue
-                
-            days = date_diff(report_date, data["posting_date"])
-            
-            if days <= 30:
-                ageing.range1 += outstanding
-            elif days <= 60:
-                ageing.range2 += outstanding
-            elif days <= 90:
-                ageing.range3 += outstanding
-            elif days <= 120:
-                ageing.range4 += outstanding
-            else:
-                ageing.range5 += outstanding
-                
     except Exception as e:
         frappe.log_error(f"Ageing calculation error: {str(e)}")
         # Fallback: Calculate from GL entries
-        ageing = calculate_ageing_from_gl(company, party, party_type, report_date)
-    
-    return ageing
+        return calculate_ageing_from_gl(company, party, party_type, report_date)
 
 
 def calculate_ageing_from_gl(company, party, party_type, report_date):
@@ -1446,58 +1394,51 @@ def calculate_ageing_from_gl(company, party, party_type, report_date):
     Fallback: Calculate ageing directly from GL entries.
     Groups outstanding amounts by posting date age.
     """
-    from frappe.utils import date_diff, getdate, flt
-    
-    ageing = frappe._dict({
-        "range1": 0,  # 0-30
-        "range2": 0,  # 30-60
-        "range3": 0,  # 60-90
-        "range4": 0,  # 90-120
-        "range5": 0,  # 120+
-    })
-    
-    report_date = getdate(report_date)
+    from frappe.utils import getdate
     
-    # Get all GL entries for this party
-    gl_entries = frappe.db.sql("""
-        SELECT posting_date, debit, credit, voucher_no, voucher_type
+    return get_ageing_buckets(
+        """
+        SELECT
+            DATEDIFF(%(report_date)s, MIN(posting_date)) AS age,
+            SUM(debit) - SUM(credit) AS outstanding
         FROM `tabGL Entry`
-        WHERE company = %s
-        AND party = %s
-        AND party_type = %s
-        AND posting_date <= %s
+        WHERE company = %(company)s
+        AND party = %(party)s
+        AND party_type = %(party_type)s
+        AND posting_date <= %(report_date)s
         AND is_cancelled = 0
-        ORDER BY posting_date
-    """, (company, party, party_type, report_date), as_dict=True)
-    
-    # Calculate net amount per voucher and assign to buckets
-    voucher_balances = {}
-    for gle in gl_entries:
-        key = (gle.voucher_type, gle.voucher_no)
-        if key not in voucher_balances:
-            voucher_balances[key] = {"posting_date": gle.posting_date, "balance": 0}
-        voucher_balances[key]["balance"] += flt(gle.debit) - flt(gle.credit)
-    
-    # Assign to ageing buckets
-    for key, data in voucher_balances.items():
-        balance = data["balance"]
-        if balance == 0:
-            continue
-            
-        days = date_diff(report_date, data["posting_date"])
-        
-        if days <= 30:
-            ageing.range1 += balance
-        elif days <= 60:
-            ageing.range2 += balance
-        elif days <= 90:
-            ageing.range3 += balance
-        elif days <= 120:
-            ageing.range4 += balance
-        else:
-            ageing.range5 += balance
+        GROUP BY voucher_type, voucher_no
+        HAVING outstanding != 0
+        """,
+        {
+            "company": company,
+            "party_type": party_type,
+            "party": party,
+            "report_date": getdate(report_date),
+        },
+    )
+
+
+def get_ageing_buckets(outstanding_query, values):
+    """
+    Sum the (age, outstanding) rows of outstanding_query into the five ageing
+    buckets in the database, so only one row comes back.
+    """
+    ageing = frappe.db.sql(
+        f"""
+        SELECT
+            SUM(CASE WHEN age <= 30 THEN outstanding ELSE 0 END) AS range1,
+            SUM(CASE WHEN age > 30 AND age <= 60 THEN outstanding ELSE 0 END) AS range2,
+            SUM(CASE WHEN age > 60 AND age <= 90 THEN outstanding ELSE 0 END) AS range3,
+            SUM(CASE WHEN age > 90 AND age <= 120 THEN outstanding ELSE 0 END) AS range4,
+            SUM(CASE WHEN age > 120 THEN outstanding ELSE 0 END) AS range5
+        FROM ({outstanding_query}) vouchers
+        """,
+        values,
+        as_dict=True,
+    )[0]
     
-    return ageing
+    return frappe._dict({bucket: flt(amount) for bucket, amount in ageing.items()})
 
 
 def get_future_payments(party, currency):
@@ -1525,25 +1466,20 @@ def get_company_bank_details(company, party_type=None, party=None):
     1) Default Bank Account for this party (party_type + party) within the company
     2) Fallback to company default bank account
     """
-    filters = {"company": company, "is_default": 1}
-
-    bank = None
-    if party_type and party:
-        bank = frappe.db.get_value(
-            "Bank Account",
-            {**filters, "party_type": party_type, "party": party},
-            ["account_name", "bank", "bank_account_no", "branch_code", "iban"],
-            as_dict=True,
-        )
-
-    if not bank:
-        bank = frappe.db.get_value(
-            "Bank Account",
-            filters,
-            ["account_name", "bank", "bank_account_no", "branch_code", "iban"],
-            as_dict=True,
-        )
+    # One lookup over the company's default accounts, ranking the party's own
+    # account first so the company default is only used when it has none
+    bank = frappe.db.sql(
+        """
+        SELECT account_name, bank, bank_account_no, branch_code, iban
+        FROM `tabBank Account`
+        WHERE company = %(company)s AND is_default = 1
+        ORDER BY (party_type = %(party_type)s AND party = %(party)s) DESC
+        LIMIT 1
+        """,
+        {"company": company, "party_type": party_type or "", "party": party or ""},
+        as_dict=True,
+    )
 
-    return bank or frappe._dict()
+    return bank[0] if bank else frappe._dict()
 
 
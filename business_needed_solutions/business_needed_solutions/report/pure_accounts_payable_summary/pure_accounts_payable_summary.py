@@ -1,14 +1,17 @@
 # Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
 # License: GNU General Public License v3. See license.txt
 
+from collections import defaultdict
+
 import frappe
 from frappe import _, scrub
+from frappe.query_builder.functions import Coalesce
 from urllib.parse import quote
 from frappe.utils import cint, flt
 from business_needed_solutions.business_needed_solutions.report.pure_accounts_receivable_summary.pure_accounts_receivable_summary import (
 	AccountsReceivablePayableSummary, get_fiscal_year_dates, 
 	get_supplier_invoice_and_received_amounts, get_customer_invoice_and_paid_amounts,
-	redistribute_negative_ageing_buckets
+	net_party_row, redistribute_negative_ageing_buckets
 )
 
 
@@ -43,11 +46,13 @@ def execute(filters=None):
 	secondary_filters.party_type = "Customer"
 	secondary_filters.party = []
 
+	# Party Links drive both the secondary party filter and the netting below
+	party_links = frappe.get_all(
+		"Party Link",
+		fields=["primary_party", "primary_role", "secondary_party", "secondary_role"],
+	)
+
 	if filters.get("party_type") == "Supplier" and filters.get("party"):
-		party_links = frappe.get_all(
-			"Party Link",
-			fields=["primary_party", "primary_role", "secondary_party", "secondary_role"],
-		)
 		mapped_customers = set()
 		for pl in party_links:
 			# Supplier (primary) -> Customer (secondary)
@@ -79,25 +84,18 @@ def execute(filters=None):
 		
 		# Check which of these exist as Supplier (for common parties)
 		if all_parties:
-			supplier_addresses = frappe.get_all(
-				"Supplier",
-				fields=["name", "supplier_primary_address"],
-				filters={"name": ["in", all_parties]}
+			supplier = frappe.qb.DocType("Supplier")
+			address = frappe.qb.DocType("Address")
+			supplier_cities = dict(
+				frappe.qb.from_(supplier)
+				.left_join(address)
+				.on(address.name == supplier.supplier_primary_address)
+				.select(supplier.name, Coalesce(address.city, ""))
+				.where(supplier.name.isin(all_parties))
+				.where(Coalesce(supplier.supplier_primary_address, "") != "")
+				.run()
 			)
 			
-			address_list = [d.supplier_primary_address for d in supplier_addresses if d.supplier_primary_address]
-			if address_list:
-				addresses = frappe.get_all(
-					"Address",
-					fields=["name", "city"],
-					filters={"name": ["in", address_list]}
-				)
-				address_city_map = {d.name: d.city for d in addresses}
-				
-				for supplier in supplier_addresses:
-					if supplier.supplier_primary_address:
-						supplier_cities[supplier.name] = address_city_map.get(supplier.supplier_primary_address, "")
-			
 			# Add city to main_data for suppliers
 			for row in main_data:
 				if row.get("party_type") == "Supplier" or row.get("party") in supplier_cities:
@@ -122,32 +120,21 @@ def execute(filters=None):
 	# 4. Gather Party Link information:
 	#    - primary_map: maps primary_party -> [secondary_party1, ...]
 	#    - skip_set: all secondary_party, to be skipped entirely.
-	party_links = frappe.get_all(
-		"Party Link",
-		fields=["primary_party", "primary_role", "secondary_party", "secondary_role"],
-	)
-
-	primary_map = {}
-	skip_set = set()
+	#    - secondary_to_primary: secondary_party -> its (first) primary_party
+	primary_map = defaultdict(list)
+	skip_set = {pl.secondary_party for pl in party_links}
+	secondary_to_primary = {}
 
 	for pl in party_links:
-		primary = pl.primary_party
-		secondary = pl.secondary_party
-
-		if primary not in primary_map:
-			primary_map[primary] = []
-		primary_map[primary].append(secondary)
-
-		skip_set.add(secondary)
+		primary_map[pl.primary_party].append(pl.secondary_party)
+		secondary_to_primary.setdefault(pl.secondary_party, pl.primary_party)
 
 	# 5. Define numeric fields to net (non-ageing)
+	#    Only amounts the report shows are netted: invoiced / paid / credit_note
+	#    have no column here, and future amounts only with show_future_payments.
 	numeric_fields = [
-		"invoiced",
-		"paid",
-		"credit_note",
 		"outstanding",
 		"total_due",
-		"future_amount",
 		"opening",
 	]
 
@@ -155,7 +142,7 @@ def execute(filters=None):
 		numeric_fields.extend(["gl_balance", "diff"])
 
 	if filters.get("show_future_payments"):
-		numeric_fields.append("remaining_balance")
+		numeric_fields.extend(["future_amount", "remaining_balance"])
 
 	# Ageing buckets (range1, range2, ...) taken directly from columns
 	ageing_bucket_fields = [
@@ -164,6 +151,7 @@ def execute(filters=None):
 		if col.get("fieldname", "").startswith("range")
 	]
 	ageing_bucket_fields = [f for f in ageing_bucket_fields if f]
+	netted_fields = numeric_fields + ageing_bucket_fields
 
 	# 5a. Build mapping of supplier parties to their linked customer parties
 	# and get customer invoice/paid amounts for those customers
@@ -219,6 +207,17 @@ def execute(filters=None):
 	#    - For Party Links: still apply netting but respect net balance categorization
 	final_data = []
 	processed_common_parties = set()
+
+	# Get Payable accounts to filter Party GL by account_type
+	payable_accounts = frappe.get_all(
+		"Account",
+		filters={"account_type": "Payable", "company": company},
+		pluck="name"
+	)
+	account_filter = quote(",".join(payable_accounts)) if payable_accounts else "undefined"
+
+	# Everything but the party is the same for every Party GL link
+	gl_url_prefix = f"/app/query-report/Party%20GL?company={quote(company)}&from_date={quote(str(from_date))}&to_date={quote(str(to_date))}&account={account_filter}&group_by=Group+by+Voucher+%28Consolidated%29&project=undefined&include_dimensions=1&include_default_book_entries=1"
 	
 	for party, row in main_dict.items():
 		# Check if this party is a common party (both Customer and Supplier)
@@ -244,17 +243,7 @@ def execute(filters=None):
 			updated_row["secondary_party"] = sec_row["party"]
 			updated_row["is_common_party"] = True
 			
-			for fieldname in numeric_fields:
-				updated_row[fieldname] = (
-					flt(updated_row.get(fieldname, 0.0)) 
-					- flt(sec_row.get(fieldname, 0.0))
-				)
-
-			for fieldname in ageing_bucket_fields:
-				updated_row[fieldname] = (
-					flt(updated_row.get(fieldname, 0.0)) 
-					- flt(sec_row.get(fieldname, 0.0))
-				)
+			net_party_row(updated_row, sec_row, netted_fields)
 			
 			processed_common_parties.add(party)
 		else:
@@ -266,11 +255,7 @@ def execute(filters=None):
 			# Check if party is a secondary party in Party Link
 			if party in skip_set:
 				# Secondary party: find its primary party and net against it
-				primary_party_for_secondary = None
-				for primary_party, secondary_list in primary_map.items():
-					if party in secondary_list:
-						primary_party_for_secondary = primary_party
-						break
+				primary_party_for_secondary = secondary_to_primary.get(party)
 
 				if primary_party_for_secondary:
 					# Check if primary party exists in main_dict (same report type)
@@ -283,17 +268,7 @@ def execute(filters=None):
 							primary_row = secondary_dict[primary_party_for_secondary]
 							updated_row["secondary_party_type"] = primary_row["party_type"]
 							updated_row["secondary_party"] = primary_party_for_secondary
-							for fieldname in numeric_fields:
-								updated_row[fieldname] = (
-									flt(updated_row.get(fieldname, 0.0))
-									- flt(primary_row.get(fieldname, 0.0))
-								)
-
-							for fieldname in ageing_bucket_fields:
-								updated_row[fieldname] = (
-									flt(updated_row.get(fieldname, 0.0))
-									- flt(primary_row.get(fieldname, 0.0))
-								)
+							net_party_row(updated_row, primary_row, netted_fields)
 							was_netted = True
 
 			# For primary parties: net against their secondary parties
@@ -306,17 +281,7 @@ def execute(filters=None):
 						sec_row = secondary_dict[secondary_party]
 						updated_row["secondary_party_type"] = sec_row["party_type"]
 						updated_row["secondary_party"] = sec_row["party"]
-						for fieldname in numeric_fields:
-							updated_row[fieldname] = (
-								flt(updated_row.get(fieldname, 0.0))
-								- flt(sec_row.get(fieldname, 0.0))
-							)
-
-						for fieldname in ageing_bucket_fields:
-							updated_row[fieldname] = (
-								flt(updated_row.get(fieldname, 0.0))
-								- flt(sec_row.get(fieldname, 0.0))
-							)
+						net_party_row(updated_row, sec_row, netted_fields)
 						was_netted = True
 
 			# Direction guard for Party Link-netted parties (mirrors common-party
@@ -341,15 +306,7 @@ def execute(filters=None):
 			
 			party_name = updated_row.get("party_name") or party
 			
-			# Get Payable accounts to filter Party GL by account_type
-			payable_accounts = frappe.get_all(
-				"Account",
-				filters={"account_type": "Payable", "company": company},
-				pluck="name"
-			)
-			account_filter = quote(",".join(payable_accounts)) if payable_accounts else "undefined"
-			
-			gl_url = f"/app/query-report/Party%20GL?company={quote(company)}&from_date={quote(str(from_date))}&to_date={quote(str(to_date))}&account={account_filter}&party=%5B%22{quote(party)}%22%5D&party_name={quote(party_name)}&group_by=Group+by+Voucher+%28Consolidated%29&project=undefined&include_dimensions=1&include_default_book_entries=1"
+			gl_url = f"{gl_url_prefix}&party=%5B%22{quote(party)}%22%5D&party_name={quote(party_name)}"
 			button_html = f'<a href="{gl_url}" target="_blank" class="btn btn-xs btn-default">GL: {party_name}</a>'
 
 			updated_row["party_gl_link"] = button_html
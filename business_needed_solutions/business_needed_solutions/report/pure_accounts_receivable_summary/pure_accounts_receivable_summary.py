@@ -2,8 +2,11 @@
 # For license information, please see license.txt
 
 
+from collections import defaultdict
+
 import frappe
 from frappe import _, scrub
+from frappe.query_builder.functions import Coalesce
 from frappe.utils import cint, flt, getdate
 from urllib.parse import quote
 from erpnext.accounts.party import get_partywise_advanced_payment_amount
@@ -159,6 +162,15 @@ def get_customer_invoice_and_paid_amounts(parties, company, report_date, show_fu
 
 
 
+def net_party_row(row, other_row, fieldnames):
+	"""
+	Subtract other_row's amounts from row in place (R - P or P - R) for the
+	given numeric and ageing bucket fields.
+	"""
+	for fieldname in fieldnames:
+		row[fieldname] = flt(row.get(fieldname, 0.0)) - flt(other_row.get(fieldname, 0.0))
+
+
 def redistribute_negative_ageing_buckets(row, ageing_bucket_fields):
 	"""
 	After AR/AP netting, some ageing buckets may be negative. Redistribute by
@@ -214,11 +226,13 @@ def execute(filters=None):
 	secondary_filters.party_type = "Supplier"
 	secondary_filters.party = []
 
+	# Party Links drive both the secondary party filter and the netting below
+	party_links = frappe.get_all(
+		"Party Link",
+		fields=["primary_party", "primary_role", "secondary_party", "secondary_role"],
+	)
+
 	if filters.get("party_type") == "Customer" and filters.get("party"):
-		party_links = frappe.get_all(
-			"Party Link",
-			fields=["primary_party", "primary_role", "secondary_party", "secondary_role"],
-		)
 		mapped_suppliers = set()
 		for pl in party_links:
 			# Customer (primary) -> Supplier (secondary)
@@ -251,25 +265,18 @@ def execute(filters=None):
 		customer_cities = {}
 		customer_list = [d.get("party") for d in main_data if d.get("party_type") == "Customer"]
 		if customer_list:
-			customer_addresses = frappe.get_all(
-				"Customer",
-				fields=["name", "customer_primary_address"],
-				filters={"name": ["in", customer_list]}
+			customer = frappe.qb.DocType("Customer")
+			address = frappe.qb.DocType("Address")
+			customer_cities = dict(
+				frappe.qb.from_(customer)
+				.left_join(address)
+				.on(address.name == customer.customer_primary_address)
+				.select(customer.name, Coalesce(address.city, ""))
+				.where(customer.name.isin(customer_list))
+				.where(Coalesce(customer.customer_primary_address, "") != "")
+				.run()
 			)
 			
-			address_list = [d.customer_primary_address for d in customer_addresses if d.customer_primary_address]
-			if address_list:
-				addresses = frappe.get_all(
-					"Address",
-					fields=["name", "city"],
-					filters={"name": ["in", address_list]}
-				)
-				address_city_map = {d.name: d.city for d in addresses}
-				
-				for customer in customer_addresses:
-					if customer.customer_primary_address:
-						customer_cities[customer.name] = address_city_map.get(customer.customer_primary_address, "")
-			
 			# Add city to main_data
 			for row in main_data:
 				if row.get("party_type") == "Customer":
@@ -294,32 +301,21 @@ def execute(filters=None):
 	# 4. Gather Party Link information:
 	#    - primary_map: maps primary_party -> [secondary_party1, ...]
 	#    - skip_set: all secondary_party, to be skipped entirely.
-	party_links = frappe.get_all(
-		"Party Link",
-		fields=["primary_party", "primary_role", "secondary_party", "secondary_role"],
-	)
-
-	primary_map = {}
-	skip_set = set()
+	#    - secondary_to_primary: secondary_party -> its (first) primary_party
+	primary_map = defaultdict(list)
+	skip_set = {pl.secondary_party for pl in party_links}
+	secondary_to_primary = {}
 
 	for pl in party_links:
-		primary = pl.primary_party
-		secondary = pl.secondary_party
-
-		if primary not in primary_map:
-			primary_map[primary] = []
-		primary_map[primary].append(secondary)
-
-		skip_set.add(secondary)
+		primary_map[pl.primary_party].append(pl.secondary_party)
+		secondary_to_primary.setdefault(pl.secondary_party, pl.primary_party)
 
 	# 5. Define numeric fields to net (non-ageing)
+	#    Only amounts the report shows are netted: invoiced / paid / credit_note
+	#    have no column here, and future amounts only with show_future_payments.
 	numeric_fields = [
-		"invoiced",
-		"paid",
-		"credit_note",
 		"outstanding",
 		"total_due",
-		"future_amount",
 		"opening",
 	]
 
@@ -327,7 +323,7 @@ def execute(filters=None):
 		numeric_fields.extend(["gl_balance", "diff"])
 
 	if filters.get("show_future_payments"):
-		numeric_fields.append("remaining_balance")
+		numeric_fields.extend(["future_amount", "remaining_balance"])
 
 	# Ageing buckets (range1, range2, ...) taken directly from columns
 	ageing_bucket_fields = [
@@ -336,6 +332,7 @@ def execute(filters=None):
 		if col.get("fieldname", "").startswith("range")
 	]
 	ageing_bucket_fields = [f for f in ageing_bucket_fields if f]
+	netted_fields = numeric_fields + ageing_bucket_fields
 
 	# 5a. Build mapping of customer parties to their linked supplier parties
 	# and get supplier invoice/received amounts for those suppliers
@@ -391,6 +388,17 @@ def execute(filters=None):
 	#    - For Party Links: still apply netting but respect net balance categorization
 	final_data = []
 	processed_common_parties = set()
+
+	# Get Receivable accounts to filter Party GL by account_type
+	receivable_accounts = frappe.get_all(
+		"Account",
+		filters={"account_type": "Receivable", "company": company},
+		pluck="name"
+	)
+	account_filter = quote(",".join(receivable_accounts)) if receivable_accounts else "undefined"
+
+	# Everything but the party is the same for every Party GL link
+	gl_url_prefix = f"/app/query-report/Party%20GL?company={quote(company)}&from_date={quote(str(from_date))}&to_date={quote(str(to_date))}&account={account_filter}&group_by=Group+by+Voucher+%28Consolidated%29&project=undefined&include_dimensions=1&include_default_book_entries=1"
 	
 	for party, row in main_dict.items():
 		# Check if this party is a common party (both Customer and Supplier)
@@ -416,17 +424,7 @@ def execute(filters=None):
 			updated_row["secondary_party"] = sec_row["party"]
 			updated_row["is_common_party"] = True
 			
-			for fieldname in numeric_fields:
-				updated_row[fieldname] = (
-					flt(updated_row.get(fieldname, 0.0)) 
-					- flt(sec_row.get(fieldname, 0.0))
-				)
-
-			for fieldname in ageing_bucket_fields:
-				updated_row[fieldname] = (
-					flt(updated_row.get(fieldname, 0.0)) 
-					- flt(sec_row.get(fieldname, 0.0))
-				)
+			net_party_row(updated_row, sec_row, netted_fields)
 			
 			processed_common_parties.add(party)
 		else:
@@ -438,11 +436,7 @@ def execute(filters=None):
 			# Check if party is a secondary party in Party Link
 			if party in skip_set:
 				# Secondary party: find its primary party and net against it
-				primary_party_for_secondary = None
-				for primary_party, secondary_list in primary_map.items():
-					if party in secondary_list:
-						primary_party_for_secondary = primary_party
-						break
+				primary_party_for_secondary = secondary_to_primary.get(party)
 
 				if primary_party_for_secondary:
 					# Check if primary party exists in main_dict (same report type)
@@ -455,17 +449,7 @@ def execute(filters=None):
 							primary_row = secondary_dict[primary_party_for_secondary]
 							updated_row["secondary_party_type"] = primary_row["party_type"]
 							updated_row["secondary_party"] = primary_party_for_secondary
-							for fieldname in numeric_fields:
-								updated_row[fieldname] = (
-									flt(updated_row.get(fieldname, 0.0))
-									- flt(primary_row.get(fieldname, 0.0))
-								)
-
-							for fieldname in ageing_bucket_fields:
-								updated_row[fieldname] = (
-									flt(updated_row.get(fieldname, 0.0))
-									- flt(primary_row.get(fieldname, 0.0))
-								)
+							net_party_row(updated_row, primary_row, netted_fields)
 							was_netted = True
 
 			# For primary parties: net against their secondary parties
@@ -478,17 +462,7 @@ def execute(filters=None):
 						sec_row = secondary_dict[secondary_party]
 						updated_row["secondary_party_type"] = sec_row["party_type"]
 						updated_row["secondary_party"] = sec_row["party"]
-						for fieldname in numeric_fields:
-							updated_row[fieldname] = (
-								flt(updated_row.get(fieldname, 0.0))
-								- flt(sec_row.get(fieldname, 0.0))
-							)
-
-						for fieldname in ageing_bucket_fields:
-							updated_row[fieldname] = (
-								flt(updated_row.get(fieldname, 0.0))
-								- flt(sec_row.get(fieldname, 0.0))
-							)
+						net_party_row(updated_row, sec_row, netted_fields)
 						was_netted = True
 
 			# Direction guard for Party Link-netted parties (mirrors common-party
@@ -509,15 +483,7 @@ def execute(filters=None):
 
 			party_name = updated_row.get("party_name") or party
 			
-			# Get Receivable accounts to filter Party GL by account_type
-			receivable_accounts = frappe.get_all(
-				"Account",
-				filters={"account_type": "Receivable", "company": company},
-				pluck="name"
-			)
-			account_filter = quote(",".join(receivable_accounts)) if receivable_accounts else "undefined"
-			
-			gl_url = f"/app/query-report/Party%20GL?company={quote(company)}&from_date={quote(str(from_date))}&to_date={quote(str(to_date))}&account={account_filter}&party=%5B%22{quote(party)}%22%5D&party_name={quote(party_name)}&group_by=Group+by+Voucher+%28Consolidated%29&project=undefined&include_dimensions=1&include_default_book_entries=1"
+			gl_url = f"{gl_url_prefix}&party=%5B%22{quote(party)}%22%5D&party_name={quote(party_name)}"
 			button_html = f'<a href="{gl_url}" target="_blank" class="btn btn-xs btn-default">GL: {party_name}</a>'
 
 			updated_row["party_gl_link"] = button_html
@@ -624,16 +590,16 @@ class AccountsReceivablePayableSummary(ReceivablePayableReport):
 		# For Receivable (Asset): debit - credit (positive = customer owes us)
 		# For Payable (Liability): credit - debit (positive = we owe supplier)
 		opening_balances = {}
+		accounts = None
 		if self.filters.get("from_date"):
-			for party_type in self.party_type:
-				accounts = frappe.get_all(
-					"Account",
-					filters={"account_type": self.account_type, "company": self.filters.company},
-					pluck="name"
-				)
-				if not accounts:
-					continue
+			accounts = frappe.get_all(
+				"Account",
+				filters={"account_type": self.account_type, "company": self.filters.company},
+				pluck="name"
+			)
 
+		if accounts:
+			for party_type in self.party_type:
 				# Use different formula based on account type
 				# Compute net = debit - credit in SQL, then flip sign in Python
 				# when the account is Payable. Avoids an f-string formula in the
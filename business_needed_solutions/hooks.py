@@ -198,13 +198,17 @@ override_doctype_class = {
 
 doc_events = {
     "Address": {
-        "before_save": "business_needed_solutions.business_needed_solutions.overrides.address_preferred_flags.enforce_suppress_preferred_address"
+        "before_save": "business_needed_solutions.business_needed_solutions.overrides.address_preferred_flags.enforce_suppress_preferred_address",
+        "on_update": "business_needed_solutions.bns_branch_accounting.report.internal_transfer_receive_mismatch.internal_transfer_receive_mismatch.clear_company_address_query_cache",
+        "on_trash": "business_needed_solutions.bns_branch_accounting.report.internal_transfer_receive_mismatch.internal_transfer_receive_mismatch.clear_company_address_query_cache",
     },
     "Customer": {
         "validate": [
             "business_needed_solutions.business_needed_solutions.overrides.pan_validation.validate_pan_uniqueness",
             "business_needed_solutions.bns_branch_accounting.overrides.internal_party.enforce_bns_over_standard_internal_customer",
-        ]
+        ],
+        "on_update": "business_needed_solutions.bns_branch_accounting.report.internal_transfer_receive_mismatch.internal_transfer_receive_mismatch.clear_internal_customers_cache",
+        "on_trash": "business_needed_solutions.bns_branch_accounting.report.internal_transfer_receive_mismatch.internal_transfer_receive_mismatch.clear_internal_customers_cache",
     },
     "Supplier": {
         "validate": [